@@ -1,130 +1,53 @@
-from tkinter import N
-from dotenv import load_dotenv
-import json
+import asyncio
+import atexit
+import copy
+import functools
 import os
-from elevenlabs.client import ElevenLabs
+import time
+from pathlib import Path
+import httpx
+
+try:
+    import ijson
+    _IJSON_ERRORS = (ijson.JSONError,)
+except ImportError:  # optional; falls back to parsing the whole tunnels list
+    ijson = None
+    _IJSON_ERRORS = ()
 
 
 # from elevenlabs.types import AgentConfig, AgentTool
-# import ngrok
-from pyngrok import ngrok
 
-load_dotenv()
+# Heavy SDKs (elevenlabs, pyngrok, dotenv) are imported where they are used so that
+# importing this module for its helpers stays cheap.
+_env_loaded = False
 
 AGENT_NAME="CallPilot"
+_REQUIRED_ENV = ("ELEVENLABS_API_KEY", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER", "TO_NUMBER")
+_PUBLIC_URL_TTL = 30  # seconds
+_public_url_cache: dict[int, tuple[str, float]] = {}
+# Remembers the voice picked on first run so later runs skip the voices.get_all listing
+_VOICE_CACHE = Path(__file__).resolve().parent / ".voice_cache"
 
-
-def get_or_create_agent(client, system_prompt, all_tools):
-
-    # 1. LIST EXISTING AGENTS (use agents.list(), not get_agents())
-    response = client.conversational_ai.agents.list(search=AGENT_NAME)
-    existing_agent = None
-    if response.agents:
-        for agent in response.agents:
-            if agent.name == AGENT_NAME:
-                existing_agent = agent
-                break
-    # 2. IF FOUND, UPDATE TOOLS AND RETURN
-    if existing_agent:
-        print(f"Found existing agent: {existing_agent.name} (ID: {existing_agent.agent_id})")
-        client.conversational_ai.agents.update(
-            existing_agent.agent_id,
-            conversation_config={
-                "agent": {
-                    "prompt": {
-                        "prompt": system_prompt,
-                        "tools": all_tools
-                    }
-                },
-                "first_message": "Hi there, "
-            },
-        )
-        return existing_agent
-
-    # 3. IF NOT FOUND, CREATE NEW AGENT (use agents.create(), and include a valid voice)
-    voices_response = client.voices.get_all(show_legacy=True)
-    voice_id = voices_response.voices[0].voice_id if voices_response.voices else None
-    if not voice_id:
-        raise RuntimeError("No voices found. Add a voice at https://elevenlabs.io/app/voice-library")
-    conversation_config = {
-        "tts": {
-            "voice_id": voice_id,
-            "model_id": "eleven_flash_v2_5"
-        },
-        "agent": {
-            "prompt": {
-                "prompt": system_prompt,
-                "tools": all_tools
-            },
-            "first_message": "Hi there,"
-        }
+_CONV_CONFIG_TEMPLATE = {
+    "tts": {
+        "model_id": "eleven_flash_v2_5"
+    },
+    "agent": {
+        "prompt": {},
+        "first_message": "Hi there,"
     }
-    new_agent = client.conversational_ai.agents.create(
-        name=AGENT_NAME,
-        conversation_config=conversation_config
-    )
-    return new_agent
- 
+}
 
+# Per-language agent overrides; extend the tuple to support more languages
+_LANG_CODES = ("ar", "fr", "de", "it", "pt")
+_LANGUAGE_PRESETS = {c: {"overrides": {"agent": {"language": c}}} for c in _LANG_CODES}
 
-def import_phone_number(client, phone, sid, token):
-    phone_number_id =client.conversational_ai.phone_numbers.create(
-        request={
-            "provider": "twilio",
-            "label": "CallPilot Twilio",
-            "phone_number": phone,
-            "sid": sid,
-            "token": token
-        }
-    )
-    pid = getattr(phone_number_id, "phone_number_id", phone_number_id)
-    print("phone_number_id:", pid)
-    return pid
+# ngrok's local admin API; a short timeout so a missing ngrok fails fast
+_NGROK_PROBE = httpx.Client(base_url="http://127.0.0.1:4040", timeout=httpx.Timeout(0.3))
+atexit.register(_NGROK_PROBE.close)
 
-def make_call(client, agent_id, agent_phone_number_id, to_number):
-    response = client.conversational_ai.twilio.outbound_call(
-        agent_id=agent_id,
-        agent_phone_number_id=agent_phone_number_id,
-        to_number=to_number
-    )
-    return response
 
-
-def get_public_url(port=3001):
-    """Use PUBLIC_URL from env if set; else try ngrok local API (when ngrok is already running); else start a new tunnel."""
-    url = os.getenv("PUBLIC_URL") or os.getenv("NGROK_PUBLIC_URL")
-    if url:
-        return url.rstrip("/")
-    try:
-        import urllib.request
-        with urllib.request.urlopen("http://127.0.0.1:4040/api/tunnels", timeout=2) as resp:
-            data = json.load(resp)
-        for t in data.get("tunnels", []):
-            addr = t.get("config", {}).get("addr", "")
-            if f":{port}" in addr or addr == str(port):
-                return t.get("public_url", "").rstrip("/")
-        if data.get("tunnels"):
-            return data["tunnels"][0].get("public_url", "").rstrip("/")
-    except Exception:
-        pass
-    return ngrok.connect(port).public_url.rstrip("/")
-
-
-def main(prompt, PORT=3001):
-    public_url = get_public_url(PORT)
-    print(f"Using public URL for tools: {public_url}")
-
-    client = ElevenLabs(
-        api_key=os.getenv("ELEVENLABS_API_KEY"),
-    )
-    
-    sid = os.getenv("TWILIO_ACCOUNT_SID")
-    token = os.getenv("TWILIO_AUTH_TOKEN")
-    phone = os.getenv("TWILIO_PHONE_NUMBER")
-    to_number = os.getenv("TO_NUMBER")
-    
-    
-    system_prompt = prompt + f"""
+_PROCESS_INSTRUCTIONS = """
 
         Your process:
         1. Introduce yourself politely as calling on behalf of a client.
@@ -158,8 +81,10 @@ def main(prompt, PORT=3001):
 
     """
 
-    #agent tools:
-        
+
+@functools.lru_cache(maxsize=4)
+def _build_tools(public_url: str) -> tuple[dict, ...]:
+    """Agent tool definitions for a given public URL (cached; callers must copy before mutating)."""
     # ElevenLabs requires tool type discriminator "type": "webhook" for server/webhook tools
     availability_tool = {
         "type": "webhook",
@@ -224,51 +149,229 @@ def main(prompt, PORT=3001):
         "description": "Switch to the language the other person is speaking. Use when they speak a different language or ask to switch language.",
     }
 
-    language_presets = {
-        "ar": {
-            "overrides": {
-                "agent": {
-                    "language": "ar" 
-                }
-            }
-        },
-        "fr": {
-            "overrides": {
-                "agent": {
-                    "language": "fr"
-                }
-            }
-        },
-        "de": {
-            "overrides": {
-                "agent": {
-                    "language": "fr"
-                }
-            }
-        }
-        # You can add more: 'de' (German), 'it' (Italian), 'pt' (Portuguese), etc.
-    }
-
     voicemail_detection_tool = {
         "type": "system",
         "name": "voicemail_detection",
         "description": "Use when an automated voicemail greeting is detected (no human on the line). Optionally leave a short message with your name and callback request.",
     }
 
-    all_tools = [
+    return (
         availability_tool,
         booking_tool,
         end_call_tool,
         skip_turn_tool,
         language_detection_tool,
         voicemail_detection_tool,
-    ]
+    )
+
+
+async def _default_voice_id(client):
+    """Voice for newly created agents: env override, then the on-disk cache, then the API."""
+    voice_id = os.getenv("ELEVENLABS_DEFAULT_VOICE_ID")
+    if voice_id:
+        return voice_id
+    if _VOICE_CACHE.exists():
+        voice_id = _VOICE_CACHE.read_text().strip()
+        if voice_id:
+            return voice_id
+    voices_response = await client.voices.get_all(show_legacy=True)
+    voice_id = voices_response.voices[0].voice_id if voices_response.voices else None
+    if voice_id:
+        _VOICE_CACHE.write_text(voice_id)
+    return voice_id
+
+
+def _make_config(system_prompt, tools, voice_id=None):
+    """Per-call conversation_config; create and update share the same shape."""
+    cfg = copy.deepcopy(_CONV_CONFIG_TEMPLATE)
+    cfg["agent"]["prompt"] = {"prompt": system_prompt, "tools": tools}
+    if voice_id:
+        cfg["tts"]["voice_id"] = voice_id
+    return cfg
+
+
+def _select_or_build_config(agents_response, voice_id, system_prompt, all_tools):
+    """Pick the existing agent (if any) and build the conversation_config to push to it."""
+    existing_agent = next((a for a in (agents_response.agents or []) if a.name == AGENT_NAME), None)
+    if existing_agent:
+        return existing_agent, _make_config(system_prompt, all_tools)
+
+    if not voice_id:
+        raise RuntimeError("No voices found. Add a voice at https://elevenlabs.io/app/voice-library")
+    return None, _make_config(system_prompt, all_tools, voice_id)
+
+
+async def get_or_create_agent(client, system_prompt, all_tools, agents_response, voice_id):
+    # agents.list / voice lookup results are fetched concurrently by the caller
+    existing_agent, conversation_config = _select_or_build_config(
+        agents_response, voice_id, system_prompt, all_tools
+    )
+    # IF FOUND, UPDATE TOOLS AND RETURN
+    if existing_agent:
+        print(f"Found existing agent: {existing_agent.name} (ID: {existing_agent.agent_id})")
+        await client.conversational_ai.agents.update(
+            existing_agent.agent_id,
+            conversation_config=conversation_config,
+        )
+        return existing_agent
+
+    # IF NOT FOUND, CREATE NEW AGENT
+    new_agent = await client.conversational_ai.agents.create(
+        name=AGENT_NAME,
+        conversation_config=conversation_config
+    )
+    return new_agent
+ 
+
+
+async def import_phone_number(client, phone, sid, token):
+    response = await client.conversational_ai.phone_numbers.create(
+        request={
+            "provider": "twilio",
+            "label": "CallPilot Twilio",
+            "phone_number": phone,
+            "sid": sid,
+            "token": token
+        }
+    )
+    # Keep only the id so the full response can be released before the outbound call
+    pid = response.phone_number_id if hasattr(response, "phone_number_id") else response
+    del response
+    print("phone_number_id:", pid)
+    return pid
+
+async def make_call(client, agent_id, agent_phone_number_id, to_number):
+    response = await client.conversational_ai.twilio.outbound_call(
+        agent_id=agent_id,
+        agent_phone_number_id=agent_phone_number_id,
+        to_number=to_number
+    )
+    return response
+
+
+def get_public_url(port=3001):
+    """Use PUBLIC_URL from env if set; else try ngrok local API (when ngrok is already running); else start a new tunnel.
+
+    The resolved URL is memoized per port for _PUBLIC_URL_TTL seconds so repeated
+    main() calls don't re-query ngrok's admin API.
+    """
+    cached = _public_url_cache.get(port)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    url = _resolve_public_url(port)
+    _public_url_cache[port] = (url, time.monotonic() + _PUBLIC_URL_TTL)
+    return url
+
+
+def _iter_tunnels(resp):
+    """Yield tunnel dicts from a streamed /api/tunnels response.
+
+    With ijson installed the body is parsed incrementally so the caller can stop
+    at the first matching tunnel; otherwise the whole body is read and parsed.
+    """
+    if ijson is None:
+        resp.read()
+        yield from resp.json().get("tunnels", [])
+        return
+    found = ijson.sendable_list()
+    coro = ijson.items_coro(found, "tunnels.item")
+    for chunk in resp.iter_bytes():
+        coro.send(chunk)
+        yield from found
+        del found[:]
+    coro.close()
+    yield from found
+
+
+def _resolve_public_url(port):
+    url = os.getenv("PUBLIC_URL") or os.getenv("NGROK_PUBLIC_URL")
+    if url:
+        return url.rstrip("/")
+    try:
+        with _NGROK_PROBE.stream("GET", "/api/tunnels") as resp:
+            first = None
+            for t in _iter_tunnels(resp):
+                addr = t.get("config", {}).get("addr", "")
+                if addr.endswith(f":{port}") or addr == str(port):
+                    return t.get("public_url", "").rstrip("/")
+                if first is None:
+                    first = t
+        if first is not None:
+            return first.get("public_url", "").rstrip("/")
+    except (httpx.HTTPError, ValueError, *_IJSON_ERRORS):
+        pass
+    from pyngrok import ngrok  # only needed when no tunnel is already running
+    return ngrok.connect(port).public_url.rstrip("/")
+
+
+def _load_env():
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def main(prompt, PORT=3001):
+    _load_env()
+    # Validate config up front so a missing variable fails before any network call
+    env = os.environ
+    missing = [k for k in _REQUIRED_ENV if not env.get(k)]
+    if missing:
+        raise RuntimeError(f"Missing env: {missing}")
+
+    public_url = get_public_url(PORT)
+    print(f"Using public URL for tools: {public_url}")
+
+    asyncio.run(_run(prompt, public_url, env))
+
+
+async def _run(prompt, public_url, env):
+    # One pooled HTTP client for every ElevenLabs call below, so the agent
+    # lookup/update, phone import and outbound call share a single TLS session.
+    # http2/limits go on the transport: httpx ignores the client-level ones when
+    # a transport is passed.
+    http_client = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(keepalive_expiry=60),
+            retries=2,
+        ),
+        timeout=httpx.Timeout(15.0, connect=5.0),
+    )
+    async with http_client:
+        await _setup_and_call(prompt, public_url, http_client, env)
+
+
+async def _setup_and_call(prompt, public_url, http_client, env):
+    from elevenlabs.client import AsyncElevenLabs
+
+    client = AsyncElevenLabs(
+        api_key=env["ELEVENLABS_API_KEY"],
+        httpx_client=http_client,
+    )
+    
+    sid = env["TWILIO_ACCOUNT_SID"]
+    token = env["TWILIO_AUTH_TOKEN"]
+    phone = env["TWILIO_PHONE_NUMBER"]
+    to_number = env["TO_NUMBER"]
     
-    agent = get_or_create_agent(client, system_prompt, all_tools)
+    
+    system_prompt = prompt + _PROCESS_INSTRUCTIONS
+
+    all_tools = list(_build_tools(public_url))
+    
+    # The agent lookup, voice list and phone import are independent -- issue them together.
+    agents_response, voice_id, agent_phone_number_id = await asyncio.gather(
+        client.conversational_ai.agents.list(search=AGENT_NAME),
+        _default_voice_id(client),
+        import_phone_number(client, phone, sid, token),
+    )
+    agent = await get_or_create_agent(client, system_prompt, all_tools, agents_response, voice_id)
     agent_id = agent.agent_id if hasattr(agent, "agent_id") else agent
+    del agent
 
-    agent_phone_number_id = import_phone_number(client, phone, sid, token)
-    make_call(client, agent_id, agent_phone_number_id, to_number)
+    await make_call(client, agent_id, agent_phone_number_id, to_number)
 
 
 
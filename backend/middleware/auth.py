@@ -1,75 +1,100 @@
 """JWT verification middleware for Supabase auth tokens."""
 
 import os
-import json
+import time
+import logging
 import base64
+import hashlib
 from fastapi import Depends, HTTPException, Request
 from jose import jwt, JWTError
+from jose.exceptions import JWTClaimsError
+from utils.cache import TTLCache
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # orjson is optional; stdlib json is fine for tiny headers
+    from json import loads as _json_loads
+
+logger = logging.getLogger(__name__)
 
 # Supabase may use HS256, HS384, or HS512 depending on project config
-_ALLOWED_ALGORITHMS = ["HS256", "HS384", "HS512"]
+_ALLOWED_ALGORITHMS = ("HS256", "HS384", "HS512")
+
+# Read once at import (server.py loads .env before mounting routers); a missing
+# secret is only reported when an authenticated request actually needs it.
+_SECRET: bytes | None = os.getenv("SUPABASE_JWT_SECRET", "").strip().encode() or None
+
+# token hash -> verified payload
+_PAYLOAD_CACHE_MAX = 10_000
+_PAYLOAD_CACHE_TTL = 300  # seconds
+_payload_cache = TTLCache(maxsize=_PAYLOAD_CACHE_MAX, ttl=_PAYLOAD_CACHE_TTL)
 
 
-def _jwt_secret() -> str:
-    secret = os.getenv("SUPABASE_JWT_SECRET", "").strip()
-    if not secret:
+def _jwt_secret() -> bytes:
+    if _SECRET is None:
         raise HTTPException(
             status_code=503,
             detail="SUPABASE_JWT_SECRET is not configured in backend/.env -- add it and restart the server",
         )
-    return secret
+    return _SECRET
 
 
 def _peek_jwt_header(token: str) -> dict:
     """Decode just the JWT header (no verification) to inspect the algorithm."""
     try:
-        header_b64 = token.split(".")[0]
-        # Add padding
-        header_b64 += "=" * (4 - len(header_b64) % 4)
-        return json.loads(base64.urlsafe_b64decode(header_b64))
+        header_b64 = token.split(".", 1)[0]
+        # Over-padding is accepted by urlsafe_b64decode, so no length arithmetic needed
+        return _json_loads(base64.urlsafe_b64decode(header_b64 + "==="))
     except Exception:
         return {}
 
 
-def _decode_token(token: str, secret: str) -> dict:
-    """Attempt to decode/verify a Supabase JWT, trying allowed algorithms."""
-    # First try with the standard allowed list
+def _decode_token(token: str, secret: bytes) -> dict:
+    """Verify a token, reusing the payload of a recent successful verification.
+
+    Clients send the same JWT on every request for its ~1h lifetime, so verified
+    payloads are cached (keyed by a hash of the token) until the earlier of the
+    token's exp or _PAYLOAD_CACHE_TTL. Failed verifications are never cached.
+    """
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = _payload_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = _verify_token(token, secret)
+    ttl = _PAYLOAD_CACHE_TTL
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        _payload_cache.set(key, payload, ttl)
+    return payload
+
+
+def _verify_token(token: str, secret: bytes) -> dict:
+    """Decode/verify a Supabase JWT with the algorithm named in its header.
+
+    Falls back to skipping the audience check (some Supabase versions set a
+    different/no aud) only when the claims check -- not the signature -- failed.
+    """
+    alg = _peek_jwt_header(token).get("alg", "HS256")
+    if alg not in _ALLOWED_ALGORITHMS:
+        alg = "HS256"
+
     try:
         return jwt.decode(
             token,
             secret,
-            algorithms=_ALLOWED_ALGORITHMS,
+            algorithms=[alg],
             audience="authenticated",
         )
-    except JWTError:
-        pass
-
-    # If that fails, peek at the header to see what alg is actually used
-    header = _peek_jwt_header(token)
-    alg = header.get("alg", "unknown")
-
-    # Try again with the token's own algorithm (if it's an HMAC variant)
-    if alg.startswith("HS"):
-        try:
-            return jwt.decode(
-                token,
-                secret,
-                algorithms=[alg],
-                audience="authenticated",
-            )
-        except JWTError:
-            pass
-
-    # Final attempt: skip audience check (some Supabase versions omit it)
-    try:
+    except JWTClaimsError:
         return jwt.decode(
             token,
             secret,
-            algorithms=_ALLOWED_ALGORITHMS + ([alg] if alg.startswith("HS") else []),
+            algorithms=[alg],
             options={"verify_aud": False},
         )
-    except JWTError as exc:
-        raise exc
 
 
 def get_current_user(request: Request) -> dict:
@@ -79,7 +104,7 @@ def get_current_user(request: Request) -> dict:
     """
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
-        print(f"[AUTH] 401 – No Authorization header on {request.method} {request.url.path}")
+        logger.warning("401 – No Authorization header on %s %s", request.method, request.url.path)
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 
     token = auth_header.split(" ", 1)[1]
@@ -89,9 +114,9 @@ def get_current_user(request: Request) -> dict:
         payload = _decode_token(token, secret)
         return payload
     except JWTError as exc:
-        header = _peek_jwt_header(token)
-        print(f"[AUTH] 401 – JWT decode failed on {request.method} {request.url.path}: {exc}")
-        print(f"[AUTH]   Token alg: {header.get('alg', '?')}, Token (first 40 chars): {token[:40]}...")
+        logger.warning("401 – JWT decode failed on %s %s: %s", request.method, request.url.path, exc)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Token alg: %s, Token (first 40 chars): %s...", _peek_jwt_header(token).get("alg", "?"), token[:40])
         raise HTTPException(status_code=401, detail=f"Invalid token: {exc}")
 
 
@@ -110,6 +135,6 @@ def get_optional_user(request: Request) -> dict | None:
     try:
         return _decode_token(token, secret)
     except JWTError as exc:
-        header = _peek_jwt_header(token)
-        print(f"[AUTH] Optional auth – JWT decode failed (alg={header.get('alg', '?')}): {exc}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Optional auth – JWT decode failed (alg=%s): %s", _peek_jwt_header(token).get("alg", "?"), exc)
         return None
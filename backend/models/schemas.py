@@ -1,7 +1,7 @@
 """Pydantic request/response models for all API endpoints."""
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Any, Optional
 
 
 # ---------------------------------------------------------------------------
@@ -34,28 +34,34 @@ class OrchestrateRequest(BaseModel):
     purpose: str | None = None
     details: str | None = None
     timePreference: str | None = None
-    conversationHistory: list[dict] | None = None
+    conversationHistory: list[dict[str, Any]] | None = None
+    # Optional: latest provider turn, so the server needn't scan the history for it
+    lastProviderMessage: str | None = None
 
 
 class SimulateResponseRequest(BaseModel):
     service: str
     providerName: str
     aiMessage: str
-    conversationHistory: list[dict] | None = None
+    conversationHistory: list[dict[str, Any]] | None = None
     timePreference: str | None = None
+    # Send only the most recent history turn to the LLM
+    excludeHistory: bool = False
 
 
 class TextChatRequest(BaseModel):
     receptionistMessage: str | None = None
     provider: dict
     user: dict
-    conversationHistory: list[dict] = []
-    toolResults: list[dict] | None = None
+    conversationHistory: list[dict[str, Any]] = Field(default_factory=list)
+    toolResults: list[dict[str, Any]] | None = None
 
 
 class AnalyzeIntakeRequest(BaseModel):
     service: str
     userInput: str | None = None
+    # Clients that fetch GET /api/ai/intake-fields/{category} can skip allFields
+    includeAllFields: bool = True
 
 
 class GenerateIntakeExampleRequest(BaseModel):
@@ -1,8 +1,11 @@
 """AI/LLM endpoints -- ports of 6 Supabase Edge Functions."""
 
-import json
+import re
+import asyncio
+import hashlib
+import orjson
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from models.schemas import (
     OrchestrateRequest,
     SimulateResponseRequest,
@@ -12,6 +15,7 @@ from models.schemas import (
     GenerateCallScriptRequest,
 )
 import services.llm as llm
+from utils.cache import TTLCache
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
@@ -68,6 +72,264 @@ SERVICE_REQUIREMENTS: dict = {
     },
 }
 
+# category -> field list, resolved once at import
+_FIELDS_BY_CATEGORY: dict[str, list[dict]] = {k: v["fields"] for k, v in SERVICE_REQUIREMENTS.items()}
+
+
+def _fields_payload(fields: list[dict]) -> tuple[bytes, str]:
+    body = orjson.dumps(fields)
+    return body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+# category -> (serialized field list, ETag) for the static intake-fields endpoint
+_FIELDS_PAYLOAD = {k: _fields_payload(v) for k, v in _FIELDS_BY_CATEGORY.items()}
+_FIELDS_CACHE_CONTROL = "public, max-age=86400, immutable"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check: ``*`` or any listed tag equal to ``etag`` (weak comparison)."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Static system prompts
+#
+# Kept byte-identical across requests (no per-request values interpolated) so
+# OpenAI's automatic prefix caching can reuse them; request-specific details go
+# in a trailing message instead.
+# ---------------------------------------------------------------------------
+ORCHESTRATE_SYS_FIRST = (
+    "You are an AI phone assistant making a call to book an appointment.\n"
+    "Generate the opening message for a call to the provider named in the request.\n"
+    "Be polite, professional, and clearly state you're an AI calling on behalf of the client named in the request.\n"
+    "Keep it concise (2-3 sentences max)."
+)
+
+ORCHESTRATE_SYS_FOLLOWUP = (
+    "You are an AI phone assistant in a conversation to book an appointment.\n"
+    "Based on the provider's last response, generate an appropriate reply.\n"
+    "If they offered a time slot, confirm it.\n"
+    "If they asked a question, answer it.\n"
+    "If they can't help, thank them politely and end the call.\n"
+    "Keep responses concise (1-2 sentences)."
+)
+
+SIMULATE_SYS = (
+    "You are simulating a service provider receptionist responding to an AI assistant booking call.\n"
+    "The business name, service type and requested time preference are given in the call details.\n\n"
+    "Your role:\n- Respond naturally as a human receptionist would\n"
+    "- Consider the service type\n"
+    "- Take the requested time preference into account\n\n"
+    "Behavior guidelines:\n- 70% chance: Be helpful and offer available slots\n"
+    "- 20% chance: Be busy/fully booked this week\n- 10% chance: Be closed or unavailable\n\n"
+    "If offering availability, suggest realistic time slots within the next few days.\n"
+    "Keep responses concise (1-3 sentences) like real phone conversations."
+)
+
+TEXT_CHAT_SYS = (
+    "You are an AI booking assistant making a PHONE CALL on behalf of your client (named in CALL DETAILS).\n\n"
+    "YOUR ROLE:\n- You are CALLING the provider (named in CALL DETAILS) to book an appointment for your client\n"
+    "- You speak TO the receptionist (the human you're chatting with)\n"
+    "- You are polite, professional, and efficient - like a real secretary making a call\n\n"
+    "THE CONVERSATION:\n- The receptionist works at the provider\n"
+    "- They will offer available times, ask questions, and confirm bookings\n"
+    "- You need to find a time that works for YOUR CLIENT\n\n"
+    "TOOL RESULTS:\nWhen you receive tool results, USE THEM to respond appropriately:\n"
+    '- If client is AVAILABLE at a time -> Confirm with receptionist: "That time works for my client!"\n'
+    '- If client has a CONFLICT -> Ask for alternatives: "Unfortunately my client has a conflict then. Do you have any other times?"\n'
+    "- After getting a confirmation code -> Thank them and confirm the booking is complete\n\n"
+    'RESPOND WITH JSON:\n{\n  "agentResponse": "What you say to the receptionist",\n'
+    '  "toolCalls": [\n    { "name": "check_client_availability", "params": { "time": "the time offered" } }\n  ] or []\n}\n\n'
+    "AVAILABLE TOOLS:\n- check_client_availability: Check if your client is free. Params: { \"time\": \"tomorrow at 2pm\" }\n"
+    '- book_appointment: Finalize booking. Params: { "time": "the confirmed time", "confirmationCode": "ABC123" }\n\n'
+    "IMPORTANT RULES:\n1. When receptionist offers a time -> Call check_client_availability with that time\n"
+    "2. When you ALREADY HAVE tool results showing availability -> DON'T call the tool again, just respond based on the result\n"
+    "3. When receptionist confirms booking with a code -> Call book_appointment\n"
+    "4. Be conversational and natural"
+)
+
+ANALYZE_INTAKE_SYS = (
+    "You are an intake assistant that categorizes services and extracts information from user input.\n\n"
+    "Given a service type and user's description, you must:\n"
+    "1. Categorize the service into one of: medical, dental, automotive, salon, restaurant, general\n"
+    "2. Extract any information the user has already provided\n"
+    '3. IMPORTANT: Always extract the reason/purpose from the user\'s description into "reason_for_visit" or "issue_description" or "service_details" depending on category\n\n'
+    'Respond with JSON:\n{\n  "category": "medical|dental|automotive|salon|restaurant|general",\n'
+    '  "extracted_info": { "field_key": "value they provided" },\n  "confidence": 0.0-1.0\n}\n\n'
+    "Examples of categorization:\n"
+    '- "doctor", "clinic", "physician", "checkup", "medical" -> medical\n'
+    '- "dentist", "teeth", "dental" -> dental\n'
+    '- "mechanic", "car repair", "auto shop", "garage", "oil change" -> automotive\n'
+    '- "haircut", "salon", "spa", "nails", "barber" -> salon\n'
+    '- "restaurant", "dinner", "reservation", "table" -> restaurant\n'
+    "- anything else -> general\n\n"
+    "IMPORTANT: The user's initial description almost always contains the reason for visit - extract it!"
+)
+
+INTAKE_EXAMPLE_SYS = (
+    "You generate short, helpful placeholder examples for appointment booking forms.\n"
+    "Given a service type, generate 1-2 brief example phrases a user might type when booking.\n"
+    "Keep it under 80 characters total. Use casual, natural language.\n"
+    'Format: \'e.g., "example 1" or "example 2"\'\n'
+    "Do NOT include personal info like names or dates - just the service need."
+)
+
+CALL_SCRIPT_SYS = (
+    "You are an AI phone assistant making calls on behalf of users to book appointments.\n"
+    "Generate a natural, professional phone script for the AI to use when calling a service provider.\n"
+    "The script should:\n- Introduce the AI as calling on behalf of the user\n"
+    "- Clearly state the purpose of the call\n- Be polite and professional\n"
+    "- Handle common scenarios (availability check, booking confirmation, providing details)\n"
+    "- Be concise but thorough\n\n"
+    'Return a JSON object with:\n- "greeting": The opening line\n- "purpose": How to explain why we\'re calling\n'
+    '- "details": How to communicate any special requirements\n'
+    '- "timeRequest": How to ask about availability\n- "confirmation": How to confirm a booking\n'
+    '- "closing": How to end the call professionally'
+)
+
+
+# ---------------------------------------------------------------------------
+# Per-request prompt templates (dynamic values only, filled with str.format)
+# ---------------------------------------------------------------------------
+_ORCHESTRATE_PURPOSES = {"new_appointment": "Book new appointment", "reschedule": "Reschedule"}
+_CALL_SCRIPT_PURPOSES = {"new_appointment": "Book a new appointment", "reschedule": "Reschedule an existing appointment"}
+
+ORCHESTRATE_USER_FIRST = (
+    "Generate opening for:\nProvider: {provider}\nCalling on behalf of: {user}\n"
+    "Service: {service}\nPurpose: {purpose}\n"
+    "Details: {details}\nTime preference: {time_preference}"
+)
+
+ORCHESTRATE_USER_FOLLOWUP = (
+    'Provider\'s last response: "{last_provider}"\n'
+    "Service requested: {service}\nTime preference: {time_preference}\n"
+    "Additional context: {details}\n\nWhat should the AI say next?"
+)
+
+SIMULATE_CALL_DETAILS = (
+    'Call details:\n- Business: "{provider}"\n'
+    "- Service type: {service}\n"
+    "- Time preference requested: {time_preference}"
+)
+
+TEXT_CHAT_CALL_DETAILS = "CALL DETAILS:\n- Client: {user}\n- Provider: {provider}\n- Current date: {date}"
+
+CALL_SCRIPT_USER = (
+    "Generate a call script for:\n- Service: {service}\n- Provider: {provider}\n"
+    "- Calling for: {user}\n- Purpose: {purpose}\n"
+    "- Additional details: {details}\n- Time preference: {time_preference}"
+)
+
+
+
+# ---------------------------------------------------------------------------
+# Forced-tool schemas (built once; chat_with_tool does not mutate them)
+# ---------------------------------------------------------------------------
+ORCHESTRATE_TOOL_NAME = "ai_response"
+ORCHESTRATE_TOOL_DESCRIPTION = "Generate the AI assistant's spoken response"
+ORCHESTRATE_TOOL_PARAMS = {
+    "type": "object",
+    "properties": {
+        "message": {"type": "string", "description": "What the AI should say"},
+        "intent": {
+            "type": "string",
+            "enum": ["greeting", "request", "confirm", "clarify", "thank", "end"],
+            "description": "The intent of this message",
+        },
+    },
+    "required": ["message", "intent"],
+    "additionalProperties": False,
+}
+
+SIMULATE_TOOL_NAME = "provider_response"
+SIMULATE_TOOL_DESCRIPTION = "Generate the provider's response"
+SIMULATE_TOOL_PARAMS = {
+    "type": "object",
+    "properties": {
+        "response": {"type": "string", "description": "The provider's spoken response"},
+        "status": {
+            "type": "string",
+            "enum": ["continue", "success", "unavailable", "closed"],
+            "description": "Call status after this response",
+        },
+        "availableSlot": {
+            "type": "string",
+            "description": "If booking successful, the offered time slot (ISO 8601 format or natural language)",
+        },
+        "confirmationCode": {
+            "type": "string",
+            "description": "If booking confirmed, a confirmation code",
+        },
+    },
+    "required": ["response", "status"],
+    "additionalProperties": False,
+}
+
+SCRIPT_TOOL_NAME = "generate_script"
+SCRIPT_TOOL_DESCRIPTION = "Generate a structured call script"
+SCRIPT_TOOL_PARAMS = {
+    "type": "object",
+    "properties": {
+        "greeting": {"type": "string", "description": "Opening line for the call"},
+        "purpose": {"type": "string", "description": "How to explain the call purpose"},
+        "details": {"type": "string", "description": "How to communicate special requirements"},
+        "timeRequest": {"type": "string", "description": "How to ask about availability"},
+        "confirmation": {"type": "string", "description": "How to confirm a booking"},
+        "closing": {"type": "string", "description": "Professional closing statement"},
+    },
+    "required": ["greeting", "purpose", "details", "timeRequest", "confirmation", "closing"],
+    "additionalProperties": False,
+}
+
+
+# Keyword fast path for analyze-intake (mirrors the examples in ANALYZE_INTAKE_SYS).
+# Only categories whose reason field captures the whole description skip the LLM;
+# salon/restaurant inputs carry structured details (party size, service type) it extracts.
+_INTAKE_KEYWORDS = {
+    "doctor": "medical", "clinic": "medical", "physician": "medical", "checkup": "medical",
+    "check-up": "medical", "medical": "medical",
+    "dentist": "dental", "teeth": "dental", "tooth": "dental", "dental": "dental",
+    "mechanic": "automotive", "car repair": "automotive", "auto shop": "automotive",
+    "garage": "automotive", "oil change": "automotive",
+    "haircut": "salon", "salon": "salon", "spa": "salon", "nails": "salon", "barber": "salon",
+    "restaurant": "restaurant", "dinner": "restaurant", "reservation": "restaurant", "table": "restaurant",
+}
+_INTAKE_KEYWORD_RE = re.compile(
+    r"\b(" + "|".join(re.escape(k) for k in sorted(_INTAKE_KEYWORDS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+_REASON_KEYS = {"medical": "reason_for_visit", "dental": "reason_for_visit", "automotive": "issue_description"}
+
+
+def _classify_by_keyword(service: str, user_input: str) -> dict | None:
+    """Categorize without the LLM when the keywords point at exactly one category."""
+    if not user_input:
+        return None
+    categories = {_INTAKE_KEYWORDS[m.lower()] for m in _INTAKE_KEYWORD_RE.findall(f"{service} {user_input}")}
+    if len(categories) != 1:
+        return None
+    category = categories.pop()
+    reason_key = _REASON_KEYS.get(category)
+    if reason_key is None:
+        return None
+    return {"category": category, "extracted_info": {reason_key: user_input}, "confidence": 0.9}
+
+
+# LLM results for the intake endpoints, which see the same few services over and over
+_example_cache = TTLCache(maxsize=512, ttl=3600)
+_intake_cache = TTLCache(maxsize=2048, ttl=3600)
+
+# Turns of conversation history forwarded to the LLM; older turns only add prefill cost
+HISTORY_KEEP = 8
+
+
+def _trim_history(history: list[dict] | None, keep: int = HISTORY_KEEP) -> list[dict]:
+    return history[-keep:] if history else []
+
 
 # ---------------------------------------------------------------------------
 # 1. POST /api/ai/orchestrate  (was ai-call-orchestrator)
@@ -77,57 +339,36 @@ async def orchestrate(req: OrchestrateRequest):
     is_first = not req.conversationHistory or len(req.conversationHistory) == 0
 
     if is_first:
-        system_prompt = (
-            f"You are an AI phone assistant making a call to book an appointment.\n"
-            f"Generate the opening message for a call to {req.providerName}.\n"
-            f"Be polite, professional, and clearly state you're an AI calling on behalf of {req.userName}.\n"
-            f"Keep it concise (2-3 sentences max)."
-        )
-        purpose_text = {"new_appointment": "Book new appointment", "reschedule": "Reschedule"}.get(req.purpose or "", req.purpose or "General inquiry")
-        user_prompt = (
-            f"Generate opening for:\nService: {req.service}\nPurpose: {purpose_text}\n"
-            f"Details: {req.details or 'None'}\nTime preference: {req.timePreference or 'Flexible'}"
+        system_prompt = ORCHESTRATE_SYS_FIRST
+        user_prompt = ORCHESTRATE_USER_FIRST.format(
+            provider=req.providerName,
+            user=req.userName,
+            service=req.service,
+            purpose=_ORCHESTRATE_PURPOSES.get(req.purpose or "", req.purpose or "General inquiry"),
+            details=req.details or "None",
+            time_preference=req.timePreference or "Flexible",
         )
     else:
-        system_prompt = (
-            "You are an AI phone assistant in a conversation to book an appointment.\n"
-            "Based on the provider's last response, generate an appropriate reply.\n"
-            "If they offered a time slot, confirm it.\n"
-            "If they asked a question, answer it.\n"
-            "If they can't help, thank them politely and end the call.\n"
-            "Keep responses concise (1-2 sentences)."
-        )
-        last_provider = next(
-            (m["text"] for m in reversed(req.conversationHistory or []) if m.get("speaker") == "provider"),
+        system_prompt = ORCHESTRATE_SYS_FOLLOWUP
+        last_provider = req.lastProviderMessage or next(
+            (m["text"] for m in reversed(_trim_history(req.conversationHistory)) if m.get("speaker") == "provider"),
             "Hello?",
         )
-        user_prompt = (
-            f'Provider\'s last response: "{last_provider}"\n'
-            f"Service requested: {req.service}\nTime preference: {req.timePreference or 'Flexible'}\n"
-            f"Additional context: {req.details or 'None'}\n\nWhat should the AI say next?"
+        user_prompt = ORCHESTRATE_USER_FOLLOWUP.format(
+            last_provider=last_provider,
+            service=req.service,
+            time_preference=req.timePreference or "Flexible",
+            details=req.details or "None",
         )
 
     result = await llm.chat_with_tool(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        tool_name="ai_response",
-        tool_description="Generate the AI assistant's spoken response",
-        tool_parameters={
-            "type": "object",
-            "properties": {
-                "message": {"type": "string", "description": "What the AI should say"},
-                "intent": {
-                    "type": "string",
-                    "enum": ["greeting", "request", "confirm", "clarify", "thank", "end"],
-                    "description": "The intent of this message",
-                },
-            },
-            "required": ["message", "intent"],
-            "additionalProperties": False,
-        },
+        system=[system_prompt],
+        messages=[{"role": "user", "content": user_prompt}],
+        tool_name=ORCHESTRATE_TOOL_NAME,
+        tool_description=ORCHESTRATE_TOOL_DESCRIPTION,
+        tool_parameters=ORCHESTRATE_TOOL_PARAMS,
+        hedge_after_ms=llm.HEDGE_AFTER_MS,
     )
     return result
 
@@ -137,49 +378,25 @@ async def orchestrate(req: OrchestrateRequest):
 # ---------------------------------------------------------------------------
 @router.post("/simulate-response")
 async def simulate_response(req: SimulateResponseRequest):
-    system_prompt = (
-        f'You are simulating a service provider receptionist at "{req.providerName}" responding to an AI assistant booking call.\n\n'
-        f"Your role:\n- Respond naturally as a human receptionist would\n"
-        f"- Consider the service type: {req.service}\n"
-        f"- Time preference requested: {req.timePreference or 'flexible'}\n\n"
-        "Behavior guidelines:\n- 70% chance: Be helpful and offer available slots\n"
-        "- 20% chance: Be busy/fully booked this week\n- 10% chance: Be closed or unavailable\n\n"
-        "If offering availability, suggest realistic time slots within the next few days.\n"
-        "Keep responses concise (1-3 sentences) like real phone conversations."
+    call_details = SIMULATE_CALL_DETAILS.format(
+        provider=req.providerName,
+        service=req.service,
+        time_preference=req.timePreference or "flexible",
     )
 
     messages = [
-        {"role": "system", "content": system_prompt},
-        *(req.conversationHistory or []),
+        {"role": "system", "content": call_details},
+        *_trim_history(req.conversationHistory, keep=1 if req.excludeHistory else HISTORY_KEEP),
         {"role": "user", "content": f'AI Assistant says: "{req.aiMessage}"'},
     ]
 
     result = await llm.chat_with_tool(
         model="gpt-4o-mini",
+        system=[SIMULATE_SYS],
         messages=messages,
-        tool_name="provider_response",
-        tool_description="Generate the provider's response",
-        tool_parameters={
-            "type": "object",
-            "properties": {
-                "response": {"type": "string", "description": "The provider's spoken response"},
-                "status": {
-                    "type": "string",
-                    "enum": ["continue", "success", "unavailable", "closed"],
-                    "description": "Call status after this response",
-                },
-                "availableSlot": {
-                    "type": "string",
-                    "description": "If booking successful, the offered time slot (ISO 8601 format or natural language)",
-                },
-                "confirmationCode": {
-                    "type": "string",
-                    "description": "If booking confirmed, a confirmation code",
-                },
-            },
-            "required": ["response", "status"],
-            "additionalProperties": False,
-        },
+        tool_name=SIMULATE_TOOL_NAME,
+        tool_description=SIMULATE_TOOL_DESCRIPTION,
+        tool_parameters=SIMULATE_TOOL_PARAMS,
     )
     return result
 
@@ -192,32 +409,15 @@ async def text_chat(req: TextChatRequest):
     user_name = req.user.get("name", "the client")
     provider_name = req.provider.get("name", "the provider")
 
-    system_prompt = (
-        f'You are an AI booking assistant making a PHONE CALL on behalf of your client "{user_name}".\n\n'
-        f'YOUR ROLE:\n- You are CALLING "{provider_name}" to book an appointment for your client\n'
-        "- You speak TO the receptionist (the human you're chatting with)\n"
-        "- You are polite, professional, and efficient - like a real secretary making a call\n\n"
-        f"THE CONVERSATION:\n- The receptionist works at {provider_name}\n"
-        "- They will offer available times, ask questions, and confirm bookings\n"
-        f"- You need to find a time that works for YOUR CLIENT ({user_name})\n\n"
-        "TOOL RESULTS:\nWhen you receive tool results, USE THEM to respond appropriately:\n"
-        '- If client is AVAILABLE at a time -> Confirm with receptionist: "That time works for my client!"\n'
-        '- If client has a CONFLICT -> Ask for alternatives: "Unfortunately my client has a conflict then. Do you have any other times?"\n'
-        "- After getting a confirmation code -> Thank them and confirm the booking is complete\n\n"
-        'RESPOND WITH JSON:\n{\n  "agentResponse": "What you say to the receptionist",\n'
-        '  "toolCalls": [\n    { "name": "check_client_availability", "params": { "time": "the time offered" } }\n  ] or []\n}\n\n'
-        f"AVAILABLE TOOLS:\n- check_client_availability: Check if {user_name} is free. Params: {{ \"time\": \"tomorrow at 2pm\" }}\n"
-        '- book_appointment: Finalize booking. Params: { "time": "the confirmed time", "confirmationCode": "ABC123" }\n\n'
-        "IMPORTANT RULES:\n1. When receptionist offers a time -> Call check_client_availability with that time\n"
-        "2. When you ALREADY HAVE tool results showing availability -> DON'T call the tool again, just respond based on the result\n"
-        "3. When receptionist confirms booking with a code -> Call book_appointment\n"
-        "4. Be conversational and natural\n\n"
-        f"Current date: {datetime.now().strftime('%m/%d/%Y')}"
+    call_details = TEXT_CHAT_CALL_DETAILS.format(
+        user=user_name,
+        provider=provider_name,
+        date=datetime.now().strftime("%m/%d/%Y"),
     )
 
     messages: list[dict] = [
-        {"role": "system", "content": system_prompt},
-        *req.conversationHistory[-10:],
+        {"role": "system", "content": call_details},
+        *_trim_history(req.conversationHistory, keep=10),
     ]
 
     if req.receptionistMessage:
@@ -225,14 +425,16 @@ async def text_chat(req: TextChatRequest):
 
     if req.toolResults:
         tool_text = "\n".join(
-            f"TOOL RESULT for {t['name']}: {json.dumps(t['result'])}" for t in req.toolResults
+            f"TOOL RESULT for {t['name']}: {orjson.dumps(t['result']).decode()}" for t in req.toolResults
         )
         messages.append({
             "role": "user",
             "content": f"[SYSTEM: Tool execution completed]\n{tool_text}\n\nNow respond to the receptionist based on these results. DO NOT call the same tool again.",
         })
 
-    parsed = await llm.chat_json(model="gpt-4o-mini", messages=messages)
+    parsed = await llm.chat_json(
+        model="gpt-4o-mini", system=[TEXT_CHAT_SYS], messages=messages, hedge_after_ms=llm.HEDGE_AFTER_MS
+    )
 
     # Prevent tool-call loops when tool results already provided
     if req.toolResults:
@@ -249,56 +451,66 @@ async def text_chat(req: TextChatRequest):
 # ---------------------------------------------------------------------------
 @router.post("/analyze-intake")
 async def analyze_intake(req: AnalyzeIntakeRequest):
-    system_prompt = (
-        "You are an intake assistant that categorizes services and extracts information from user input.\n\n"
-        "Given a service type and user's description, you must:\n"
-        "1. Categorize the service into one of: medical, dental, automotive, salon, restaurant, general\n"
-        "2. Extract any information the user has already provided\n"
-        '3. IMPORTANT: Always extract the reason/purpose from the user\'s description into "reason_for_visit" or "issue_description" or "service_details" depending on category\n\n'
-        'Respond with JSON:\n{\n  "category": "medical|dental|automotive|salon|restaurant|general",\n'
-        '  "extracted_info": { "field_key": "value they provided" },\n  "confidence": 0.0-1.0\n}\n\n'
-        "Examples of categorization:\n"
-        '- "doctor", "clinic", "physician", "checkup", "medical" -> medical\n'
-        '- "dentist", "teeth", "dental" -> dental\n'
-        '- "mechanic", "car repair", "auto shop", "garage", "oil change" -> automotive\n'
-        '- "haircut", "salon", "spa", "nails", "barber" -> salon\n'
-        '- "restaurant", "dinner", "reservation", "table" -> restaurant\n'
-        "- anything else -> general\n\n"
-        "IMPORTANT: The user's initial description almost always contains the reason for visit - extract it!"
-    )
-
-    try:
-        parsed = await llm.chat_json(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f'Service: "{req.service}"\nUser input: "{req.userInput or "No additional details provided"}"'},
-            ],
-        )
-    except Exception:
-        parsed = {"category": "general", "extracted_info": {}, "confidence": 0.5}
+    user_input = (req.userInput or "").strip()
+    # Only inputs with actual details are cached; they are kept verbatim because
+    # extracted values (names, dates) are case-sensitive
+    cache_key = (req.service.strip().lower(), user_input) if user_input else None
+    parsed = _classify_by_keyword(req.service, user_input)
+    if parsed is None and cache_key:
+        parsed = _intake_cache.get(cache_key)
+    if parsed is None:
+        try:
+            parsed = await llm.chat_json(
+                model="gpt-4o-mini",
+                system=[ANALYZE_INTAKE_SYS],
+                messages=[
+                    {"role": "user", "content": f'Service: "{req.service}"\nUser input: "{req.userInput or "No additional details provided"}"'},
+                ],
+            )
+            # chat_json returns {"raw": ...} on unparseable output -- don't pin that for an hour
+            if cache_key and isinstance(parsed, dict) and "category" in parsed:
+                _intake_cache.set(cache_key, parsed)
+        except Exception:
+            parsed = {"category": "general", "extracted_info": {}, "confidence": 0.5}
 
     category = parsed.get("category", "general")
     extracted_info = parsed.get("extracted_info", {})
 
-    requirements = SERVICE_REQUIREMENTS.get(category, SERVICE_REQUIREMENTS["general"])
+    all_fields = _FIELDS_BY_CATEGORY.get(category, _FIELDS_BY_CATEGORY["general"])
 
-    missing_fields = [
-        f for f in requirements["fields"]
-        if f["required"] and not (extracted_info.get(f["key"]) or "").strip()
-    ]
-    optional_fields = [
-        f for f in requirements["fields"]
-        if not f["required"] and not (extracted_info.get(f["key"]) or "").strip()
-    ]
+    # One pass: each unfilled field goes to missing (required) or optional
+    missing_fields: list[dict] = []
+    optional_fields: list[dict] = []
+    for f in all_fields:
+        value = extracted_info.get(f["key"])
+        if value and value.strip():
+            continue
+        (missing_fields if f["required"] else optional_fields).append(f)
 
-    return {
+    result = {
         "category": category,
         "extractedInfo": extracted_info,
         "missingFields": missing_fields,
         "optionalFields": optional_fields,
-        "allFields": requirements["fields"],
     }
+    if req.includeAllFields:
+        result["allFields"] = all_fields
+    return result
+
+
+# ---------------------------------------------------------------------------
+# 4b. GET /api/ai/intake-fields/{category}  (static field list, cacheable)
+# ---------------------------------------------------------------------------
+@router.get("/intake-fields/{category}")
+async def intake_fields(category: str, request: Request):
+    payload = _FIELDS_PAYLOAD.get(category)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"Unknown intake category: {category}")
+    body, etag = payload
+    headers = {"Cache-Control": _FIELDS_CACHE_CONTROL, "ETag": etag}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # ---------------------------------------------------------------------------
@@ -306,75 +518,61 @@ async def analyze_intake(req: AnalyzeIntakeRequest):
 # ---------------------------------------------------------------------------
 @router.post("/generate-intake-example")
 async def generate_intake_example(req: GenerateIntakeExampleRequest):
+    key = req.service.strip().lower()
+    example = _example_cache.get(key)
+    if example is not None:
+        return {"example": example}
     try:
         data = await llm.chat_completion(
             model="gpt-4o-mini",
+            system=[INTAKE_EXAMPLE_SYS],
             messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You generate short, helpful placeholder examples for appointment booking forms.\n"
-                        "Given a service type, generate 1-2 brief example phrases a user might type when booking.\n"
-                        "Keep it under 80 characters total. Use casual, natural language.\n"
-                        'Format: \'e.g., "example 1" or "example 2"\'\n'
-                        "Do NOT include personal info like names or dates - just the service need."
-                    ),
-                },
                 {"role": "user", "content": f'Service: "{req.service}"'},
             ],
             max_tokens=60,
             temperature=0.7,
         )
         example = (data.get("choices") or [{}])[0].get("message", {}).get("content", "").strip()
+        if example:
+            _example_cache.set(key, example)
         return {"example": example}
     except Exception:
         return {"example": ""}
 
 
+# ---------------------------------------------------------------------------
+# 5b. POST /api/ai/analyze-and-example  (analyze-intake + generate-intake-example)
+# ---------------------------------------------------------------------------
+@router.post("/analyze-and-example")
+async def analyze_and_example(req: AnalyzeIntakeRequest):
+    """Run both intake LLM calls concurrently so the client pays one round-trip."""
+    analysis, example = await asyncio.gather(
+        analyze_intake(req),
+        generate_intake_example(GenerateIntakeExampleRequest(service=req.service)),
+    )
+    return {**analysis, **example}
+
+
 # ---------------------------------------------------------------------------
 # 6. POST /api/ai/generate-call-script  (was generate-call-script)
 # ---------------------------------------------------------------------------
 @router.post("/generate-call-script")
 async def generate_call_script(req: GenerateCallScriptRequest):
-    system_prompt = (
-        "You are an AI phone assistant making calls on behalf of users to book appointments.\n"
-        "Generate a natural, professional phone script for the AI to use when calling a service provider.\n"
-        "The script should:\n- Introduce the AI as calling on behalf of the user\n"
-        "- Clearly state the purpose of the call\n- Be polite and professional\n"
-        "- Handle common scenarios (availability check, booking confirmation, providing details)\n"
-        "- Be concise but thorough\n\n"
-        'Return a JSON object with:\n- "greeting": The opening line\n- "purpose": How to explain why we\'re calling\n'
-        '- "details": How to communicate any special requirements\n'
-        '- "timeRequest": How to ask about availability\n- "confirmation": How to confirm a booking\n'
-        '- "closing": How to end the call professionally'
-    )
-    purpose_text = {"new_appointment": "Book a new appointment", "reschedule": "Reschedule an existing appointment"}.get(req.purpose or "", req.purpose or "General inquiry")
-    user_prompt = (
-        f"Generate a call script for:\n- Service: {req.service}\n- Provider: {req.providerName}\n"
-        f"- Calling for: {req.userName}\n- Purpose: {purpose_text}\n"
-        f"- Additional details: {req.details or 'None provided'}\n- Time preference: {req.timePreference or 'Flexible'}"
+    user_prompt = CALL_SCRIPT_USER.format(
+        service=req.service,
+        provider=req.providerName,
+        user=req.userName,
+        purpose=_CALL_SCRIPT_PURPOSES.get(req.purpose or "", req.purpose or "General inquiry"),
+        details=req.details or "None provided",
+        time_preference=req.timePreference or "Flexible",
     )
 
     result = await llm.chat_with_tool(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        tool_name="generate_script",
-        tool_description="Generate a structured call script",
-        tool_parameters={
-            "type": "object",
-            "properties": {
-                "greeting": {"type": "string", "description": "Opening line for the call"},
-                "purpose": {"type": "string", "description": "How to explain the call purpose"},
-                "details": {"type": "string", "description": "How to communicate special requirements"},
-                "timeRequest": {"type": "string", "description": "How to ask about availability"},
-                "confirmation": {"type": "string", "description": "How to confirm a booking"},
-                "closing": {"type": "string", "description": "Professional closing statement"},
-            },
-            "required": ["greeting", "purpose", "details", "timeRequest", "confirmation", "closing"],
-            "additionalProperties": False,
-        },
+        system=[CALL_SCRIPT_SYS],
+        messages=[{"role": "user", "content": user_prompt}],
+        tool_name=SCRIPT_TOOL_NAME,
+        tool_description=SCRIPT_TOOL_DESCRIPTION,
+        tool_parameters=SCRIPT_TOOL_PARAMS,
     )
     return {"script": result}
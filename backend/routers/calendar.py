@@ -1,63 +1,131 @@
 """Calendar endpoints (Google Calendar integration) -- moved from server.py."""
 
 import os
+import asyncio
+import functools
+from calendar import isleap
 from datetime import datetime, timedelta
+from urllib.parse import quote as url_quote
+
+import httpx
 from fastapi import APIRouter, HTTPException
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from models.schemas import AvailabilityRequest, BookingRequest
+from utils.cache import TTLCache
 
 router = APIRouter(prefix="/api/calendar", tags=["calendar"])
 
 
-def _get_calendar_service():
-    creds = Credentials(
+_CALENDAR_ID = os.getenv("CALENDAR_ID", "primary")
+_GOOGLE_REFRESH_TOKEN = os.getenv("GOOGLE_REFRESH_TOKEN")
+_GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+_GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+_EVENTS_PATH = f"/calendars/{url_quote(_CALENDAR_ID, safe='')}/events"
+
+# Async REST client for the Calendar API: googleapiclient's execute() is blocking
+# and would stall the event loop for the whole Google round-trip.
+_client = httpx.AsyncClient(
+    base_url="https://www.googleapis.com/calendar/v3",
+    http2=True,
+    timeout=15,
+)
+
+
+async def aclose() -> None:
+    await _client.aclose()
+
+
+# (time_min, time_max) -> availability response; cleared whenever we book a slot
+_availability_cache = TTLCache(maxsize=256, ttl=30)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_credentials() -> Credentials:
+    """Process-wide OAuth credentials; the access token is refreshed on demand.
+
+    Call ``reset_credentials()`` if the refresh token rotates.
+    """
+    return Credentials(
         token=None,
-        refresh_token=os.getenv("GOOGLE_REFRESH_TOKEN"),
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        refresh_token=_GOOGLE_REFRESH_TOKEN,
+        client_id=_GOOGLE_CLIENT_ID,
+        client_secret=_GOOGLE_CLIENT_SECRET,
         token_uri="https://oauth2.googleapis.com/token",
     )
-    return build("calendar", "v3", credentials=creds)
 
 
-def _ensure_future_date(dt: datetime) -> datetime:
-    now = datetime.now()
+def reset_credentials() -> None:
+    _get_credentials.cache_clear()
+
+
+_refresh_lock = asyncio.Lock()
+_booking_lock = asyncio.Lock()
+
+
+async def _auth_headers() -> dict:
+    """Bearer header for the cached access token, refreshing it only once it expires."""
+    creds = _get_credentials()
+    if not creds.valid:
+        async with _refresh_lock:
+            # Concurrent requests wait for one refresh instead of each starting their own
+            if not creds.valid:
+                # google-auth's refresh is synchronous -- keep it off the event loop
+                await asyncio.to_thread(creds.refresh, GoogleAuthRequest())
+    return {"Authorization": f"Bearer {creds.token}"}
+
+
+async def _list_events(**params) -> dict:
+    resp = await _client.get(_EVENTS_PATH, params=params, headers=await _auth_headers())
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _insert_event(body: dict) -> dict:
+    resp = await _client.post(_EVENTS_PATH, json=body, headers=await _auth_headers())
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _ensure_future_date(dt: datetime, now: datetime | None = None) -> datetime:
+    """Move a past date to this year, or next year, so bookings never land in the past."""
+    now = now or datetime.now()
     if dt >= now:
         return dt
-    try:
-        this_year = dt.replace(year=now.year)
-        if this_year >= now:
-            return this_year
-    except ValueError:
-        pass
-    try:
-        return dt.replace(year=now.year + 1)
-    except ValueError:
+    # Only Feb 29 can fail to move to another year; handle it explicitly
+    leap_day = dt.month == 2 and dt.day == 29
+    if leap_day and not isleap(now.year):
+        return dt.replace(year=now.year + 1) if isleap(now.year + 1) else dt
+    this_year = dt.replace(year=now.year)
+    if this_year >= now:
+        return this_year
+    if leap_day:
         return dt
+    return dt.replace(year=now.year + 1)
 
 
 @router.post("/check-availability")
 async def check_availability(req: AvailabilityRequest):
     try:
-        service = _get_calendar_service()
+        now = datetime.now()
         if req.date:
             try:
                 target_date = datetime.fromisoformat(req.date.replace("Z", "").strip())
-                target_date = _ensure_future_date(target_date)
+                target_date = _ensure_future_date(target_date, now)
             except ValueError:
-                target_date = datetime.now()
+                target_date = now
         else:
-            target_date = datetime.now()
+            target_date = now
 
-        time_min = req.time_min or target_date.replace(hour=0, minute=0).strftime("%Y-%m-%dT%H:%M:%S") + "Z"
-        time_max = req.time_max or target_date.replace(hour=23, minute=59).strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+        time_min = req.time_min or target_date.replace(hour=0, minute=0, second=0).isoformat(timespec="seconds") + "Z"
+        time_max = req.time_max or target_date.replace(hour=23, minute=59, second=59).isoformat(timespec="seconds") + "Z"
 
-        events = (
-            service.events()
-            .list(calendarId=os.getenv("CALENDAR_ID", "primary"), timeMin=time_min, timeMax=time_max, singleEvents=True, orderBy="startTime")
-            .execute()
-        )
+        cache_key = (time_min, time_max)
+        cached = _availability_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        events = await _list_events(timeMin=time_min, timeMax=time_max, singleEvents="true", orderBy="startTime")
 
         busy_slots = [
             {
@@ -68,12 +136,15 @@ async def check_availability(req: AvailabilityRequest):
             for e in events.get("items", [])
         ]
 
+        day = target_date.date().isoformat()
         msg = (
-            f"On {target_date.date().isoformat()}: {len(busy_slots)} existing event(s)."
+            f"On {day}: {len(busy_slots)} existing event(s)."
             if busy_slots
-            else f"On {target_date.date().isoformat()}: no events; day is free."
+            else f"On {day}: no events; day is free."
         )
-        return {"success": True, "date": target_date.date().isoformat(), "busy_slots": busy_slots, "message": msg}
+        result = {"success": True, "date": day, "busy_slots": busy_slots, "message": msg}
+        _availability_cache.set(cache_key, result)
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -81,54 +152,50 @@ async def check_availability(req: AvailabilityRequest):
 @router.post("/book-slot")
 async def book_slot(req: BookingRequest):
     try:
-        service = _get_calendar_service()
         try:
             start_dt = datetime.fromisoformat(req.start_time.replace("Z", "").strip())
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid start_time format: {req.start_time}")
 
-        start_dt = _ensure_future_date(start_dt)
+        now = datetime.now()
+        start_dt = _ensure_future_date(start_dt, now)
 
         if req.end_time:
             try:
                 end_dt = datetime.fromisoformat(req.end_time.replace("Z", "").strip())
             except ValueError:
                 end_dt = start_dt + timedelta(hours=1)
-            end_dt = _ensure_future_date(end_dt)
+            end_dt = _ensure_future_date(end_dt, now)
         else:
             end_dt = start_dt + timedelta(hours=1)
 
-        final_start = start_dt.strftime("%Y-%m-%dT%H:%M:%S")
-        final_end = end_dt.strftime("%Y-%m-%dT%H:%M:%S")
-
-        conflicts = (
-            service.events()
-            .list(calendarId=os.getenv("CALENDAR_ID", "primary"), timeMin=final_start + "Z", timeMax=final_end + "Z", singleEvents=True)
-            .execute()
-        )
-
-        items = conflicts.get("items") or []
-        if items:
-            summaries = [e.get("summary", "Busy") for e in items]
-            return {
-                "success": False,
-                "error": "Time slot conflicts with an existing calendar event.",
-                "message": f"Cannot book: calendar already has event(s) in this window: {', '.join(summaries)}.",
-            }
-
-        event = (
-            service.events()
-            .insert(
-                calendarId=os.getenv("CALENDAR_ID", "primary"),
-                body={
+        final_start = start_dt.isoformat(timespec="seconds")
+        final_end = end_dt.isoformat(timespec="seconds")
+        start_utc = final_start + "Z"
+        end_utc = final_end + "Z"
+
+        # List-then-insert runs under a lock so two requests for the same free slot
+        # can't both pass the conflict check (one calendar per process)
+        async with _booking_lock:
+            conflicts = await _list_events(timeMin=start_utc, timeMax=end_utc, singleEvents="true")
+            items = conflicts.get("items") or []
+            if items:
+                summaries = [e.get("summary", "Busy") for e in items]
+                return {
+                    "success": False,
+                    "error": "Time slot conflicts with an existing calendar event.",
+                    "message": f"Cannot book: calendar already has event(s) in this window: {', '.join(summaries)}.",
+                }
+            try:
+                event = await _insert_event({
                     "summary": req.title or "Dental Appointment",
                     "description": req.description or "Booked via AI assistant",
-                    "start": {"dateTime": final_start + "Z", "timeZone": "UTC"},
-                    "end": {"dateTime": final_end + "Z", "timeZone": "UTC"},
-                },
-            )
-            .execute()
-        )
+                    "start": {"dateTime": start_utc, "timeZone": "UTC"},
+                    "end": {"dateTime": end_utc, "timeZone": "UTC"},
+                })
+            finally:
+                # The insert may have landed even if the call failed
+                _availability_cache.clear()
 
         return {"success": True, "event_id": event["id"], "message": f"Booked for {final_start} to {final_end}.", "start": final_start, "end": final_end}
     except Exception as e:
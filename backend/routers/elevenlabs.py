@@ -3,7 +3,8 @@
 import os
 import httpx
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from models.schemas import TTSRequest, ConversationTokenRequest
 
 router = APIRouter(prefix="/api/elevenlabs", tags=["elevenlabs"])
@@ -14,11 +15,28 @@ VOICES = {
 }
 
 
+# One pooled client for the app's lifetime so requests reuse the kept-alive TLS
+# connection to api.elevenlabs.io; closed from the app lifespan in server.py.
+_client = httpx.AsyncClient(
+    base_url="https://api.elevenlabs.io",
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+)
+
+
+async def aclose() -> None:
+    await _client.aclose()
+
+
+# Read once at import (server.py loads .env first); still reported lazily per request
+_ELEVEN_KEY = os.getenv("ELEVENLABS_API_KEY")
+
+
 def _api_key() -> str:
-    key = os.getenv("ELEVENLABS_API_KEY")
-    if not key:
+    if not _ELEVEN_KEY:
         raise RuntimeError("ELEVENLABS_API_KEY must be set")
-    return key
+    return _ELEVEN_KEY
 
 
 # ---------------------------------------------------------------------------
@@ -28,29 +46,37 @@ def _api_key() -> str:
 async def text_to_speech(req: TTSRequest):
     voice_id = VOICES.get(req.speaker, VOICES["ai_assistant"])
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}?output_format=mp3_44100_128",
-            headers={
-                "xi-api-key": _api_key(),
-                "Content-Type": "application/json",
-            },
-            json={
-                "text": req.text,
-                "model_id": "eleven_turbo_v2_5",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.75,
-                    "style": 0.3,
-                    "use_speaker_boost": True,
-                },
+    request = _client.build_request(
+        "POST",
+        f"/v1/text-to-speech/{voice_id}?output_format=mp3_44100_128",
+        headers={
+            "xi-api-key": _api_key(),
+            "Content-Type": "application/json",
+        },
+        json={
+            "text": req.text,
+            "model_id": "eleven_turbo_v2_5",
+            "voice_settings": {
+                "stability": 0.5,
+                "similarity_boost": 0.75,
+                "style": 0.3,
+                "use_speaker_boost": True,
             },
-        )
+        },
+    )
+    # Stream the audio through as ElevenLabs generates it instead of buffering the whole MP3
+    resp = await _client.send(request, stream=True)
 
     if not resp.is_success:
+        await resp.aread()
+        await resp.aclose()
         raise HTTPException(status_code=resp.status_code, detail=f"ElevenLabs TTS error: {resp.text}")
 
-    return Response(content=resp.content, media_type="audio/mpeg")
+    return StreamingResponse(
+        resp.aiter_bytes(chunk_size=16384),
+        media_type="audio/mpeg",
+        background=BackgroundTask(resp.aclose),
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -58,11 +84,11 @@ async def text_to_speech(req: TTSRequest):
 # ---------------------------------------------------------------------------
 @router.post("/conversation-token")
 async def conversation_token(req: ConversationTokenRequest):
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.get(
-            f"https://api.elevenlabs.io/v1/convai/conversation/get-signed-url?agent_id={req.agentId}",
-            headers={"xi-api-key": _api_key()},
-        )
+    resp = await _client.get(
+        f"/v1/convai/conversation/get-signed-url?agent_id={req.agentId}",
+        headers={"xi-api-key": _api_key()},
+        timeout=15,
+    )
 
     if resp.status_code == 401:
         raise HTTPException(status_code=401, detail="Invalid ElevenLabs API key")
@@ -80,11 +106,11 @@ async def conversation_token(req: ConversationTokenRequest):
 # ---------------------------------------------------------------------------
 @router.post("/scribe-token")
 async def scribe_token():
-    async with httpx.AsyncClient(timeout=15) as client:
-        resp = await client.post(
-            "https://api.elevenlabs.io/v1/single-use-token/realtime_scribe",
-            headers={"xi-api-key": _api_key()},
-        )
+    resp = await _client.post(
+        "/v1/single-use-token/realtime_scribe",
+        headers={"xi-api-key": _api_key()},
+        timeout=15,
+    )
 
     if not resp.is_success:
         raise HTTPException(status_code=resp.status_code, detail=f"ElevenLabs scribe error: {resp.text}")
@@ -7,6 +7,11 @@ from models.schemas import ProfileUpdate
 
 router = APIRouter(prefix="/api/profiles", tags=["profiles"])
 
+# Explicit projection matching the frontend's Profile type (frontend/src/types/index.ts)
+_PROFILE_COLUMNS = (
+    "id,user_id,email,phone,phone_verified,calendar_connected,full_name,date_of_birth,created_at,updated_at"
+)
+
 
 @router.get("/me")
 async def get_profile(user: dict | None = Depends(get_optional_user)):
@@ -16,7 +21,7 @@ async def get_profile(user: dict | None = Depends(get_optional_user)):
 
     user_id = user.get("sub")
     sb = get_supabase()
-    result = sb.table("profiles").select("*").eq("user_id", user_id).maybe_single().execute()
+    result = sb.table("profiles").select(_PROFILE_COLUMNS).eq("user_id", user_id).maybe_single().execute()
     if not result.data:
         return None
     return result.data
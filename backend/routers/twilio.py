@@ -1,36 +1,173 @@
 """Twilio endpoints -- phone verification, calls, webhook handler, media-stream WebSocket."""
 
 import os
-import json
+import time
 import struct
 import asyncio
-from base64 import b64encode, b64decode
+from collections import deque
+from collections.abc import AsyncIterator
+from base64 import b64encode
+from binascii import a2b_base64
 from urllib.parse import quote as url_quote
 
 import httpx
+import orjson
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.responses import Response as FastAPIResponse
 from models.schemas import VerifyPhoneRequest, TestCallRequest, MakeCallRequest
 import services.llm as llm
-from services.supabase_client import get_supabase
-from utils.audio import mulaw_to_pcm, pcm_to_mulaw, resample, create_wav
+from services.supabase_client import broadcast_endpoint
+from utils.audio import WavReader, mulaw_to_pcm_resampled
+from utils.cache import TTLCache
+from utils.retry import retry_wait
+
+try:
+    from pybase64 import b64decode as _decode_payload  # SIMD-accelerated decoder
+except ImportError:  # optional; binascii skips base64.b64decode's Python-level wrapper
+    _decode_payload = a2b_base64
 
 router = APIRouter(prefix="/api/twilio", tags=["twilio"])
 
+# Shared pooled client for Twilio REST and the ElevenLabs STT/TTS calls made during
+# live calls; Twilio REST calls pass their own shorter timeout.
+_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+
+_TWILIO_TIMEOUT = 15
+
+# Twilio enforces per-account API concurrency; stay under it instead of eating 429s
+_twilio_slots = asyncio.Semaphore(10)
+
+MAX_RETRIES = 3
+INITIAL_BACKOFF = 0.25  # seconds
+MAX_WAIT = 5  # retries hold the inbound request open, so never honour a long Retry-After
+# Only GETs are retried on 5xx -- a failed POST (e.g. Calls.json) may still have taken effect
+_RETRY_ON_GET = frozenset({429, 500, 502, 503, 504})
+_RETRY_ON_POST = frozenset({429})
+
+
+async def aclose() -> None:
+    await _client.aclose()
+
+
+async def _send(
+    method: str,
+    url: str,
+    *,
+    limiter: asyncio.Semaphore | None = None,
+    stream: bool = False,
+    **kwargs,
+) -> httpx.Response:
+    """Send via the shared client, retrying 429s (and 5xx for GETs) with exponential backoff.
+
+    With ``stream=True`` the body is left unread; the caller must close the response.
+    """
+    retry_on = _RETRY_ON_GET if method == "GET" else _RETRY_ON_POST
+    for attempt in range(MAX_RETRIES + 1):
+        request = _client.build_request(method, url, **kwargs)
+        if limiter is None:
+            resp = await _client.send(request, stream=stream)
+        else:
+            async with limiter:
+                resp = await _client.send(request, stream=stream)
+        if resp.status_code not in retry_on or attempt == MAX_RETRIES:
+            return resp
+        if stream:
+            await resp.aclose()
+        wait = retry_wait(
+            resp.headers.get("retry-after"), attempt, initial_backoff=INITIAL_BACKOFF, max_wait=MAX_WAIT
+        )
+        print(f"[HTTP] {resp.status_code} from {url.split('?')[0]}, retrying in {wait:.2f}s (attempt {attempt + 1}/{MAX_RETRIES})")
+        await asyncio.sleep(wait)
+    return resp
+
+
+async def _twilio(method: str, url: str, **kwargs) -> httpx.Response:
+    return await _send(method, url, limiter=_twilio_slots, timeout=_TWILIO_TIMEOUT, **kwargs)
+
+
+# Settings resolved once at import (server.py loads .env before importing routers);
+# missing values only raise when an endpoint needs them.
+_TWILIO_SID = os.getenv("TWILIO_SID") or os.getenv("TWILIO_ACCOUNT_SID")
+_TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+_TWILIO_SECRET = os.getenv("TWILIO_API_KEY") or _TWILIO_AUTH_TOKEN
+_TWILIO_BASE = f"https://api.twilio.com/2010-04-01/Accounts/{_TWILIO_SID}"
+_ELEVEN_KEY = os.getenv("ELEVENLABS_API_KEY", "")
+_PUBLIC_URL = os.getenv("PUBLIC_URL") or os.getenv("NGROK_PUBLIC_URL") or ""
+_MEDIA_STREAM_URL = _PUBLIC_URL.replace("https://", "wss://").replace("http://", "ws://") + "/api/twilio/media-stream"
+_CALL_HANDLER_URL = _PUBLIC_URL.rstrip("/") + "/api/twilio/call-handler"
+
+
+def _basic_auth(user: str | None, secret: str | None) -> str | None:
+    return b64encode(f"{user}:{secret}".encode()).decode() if user and secret else None
+
+
+# Precomputed base64 Basic-auth values (the credentials never change at runtime)
+_TWILIO_BASIC = _basic_auth(_TWILIO_SID, _TWILIO_SECRET)
+_TWILIO_TOKEN_BASIC = _basic_auth(_TWILIO_SID, _TWILIO_AUTH_TOKEN)
 
-def _twilio_auth(sid: str | None = None, secret: str | None = None) -> str:
+
+def _twilio_auth() -> str:
     """Return base64-encoded Basic auth for Twilio."""
-    sid = sid or os.getenv("TWILIO_SID") or os.getenv("TWILIO_ACCOUNT_SID")
-    secret = secret or os.getenv("TWILIO_API_KEY") or os.getenv("TWILIO_AUTH_TOKEN")
-    if not sid or not secret:
+    if not _TWILIO_BASIC:
         raise RuntimeError("Twilio credentials not configured")
-    import base64
-    return base64.b64encode(f"{sid}:{secret}".encode()).decode()
+    return _TWILIO_BASIC
+
+
+def _twilio_base() -> str:
+    return _TWILIO_BASE
+
+
+# account SID -> first incoming number, so test calls skip the lookup round-trip
+_from_number_cache = TTLCache(maxsize=8, ttl=600)
+_from_number_lock = asyncio.Lock()
 
 
-def _twilio_base(sid: str | None = None) -> str:
-    sid = sid or os.getenv("TWILIO_SID") or os.getenv("TWILIO_ACCOUNT_SID")
-    return f"https://api.twilio.com/2010-04-01/Accounts/{sid}"
+async def _test_from_number(sid: str, base: str, auth: str) -> str:
+    """Twilio number to place test calls from; looked up once per account every 10 minutes."""
+    number = _from_number_cache.get(sid)
+    if number is not None:
+        return number
+    async with _from_number_lock:
+        number = _from_number_cache.get(sid)
+        if number is not None:
+            return number
+        nums_resp = await _twilio(
+            "GET",
+            f"{base}/IncomingPhoneNumbers.json?PageSize=1",
+            headers={"Authorization": f"Basic {auth}"},
+        )
+        nums = nums_resp.json()
+        if not nums_resp.is_success or not nums.get("incoming_phone_numbers"):
+            raise HTTPException(status_code=500, detail="No Twilio phone number found in your account")
+        number = nums["incoming_phone_numbers"][0]["phone_number"]
+        _from_number_cache.set(sid, number)
+        return number
+
+
+# TwiML templates, rendered with a single format_map per call
+_STREAM_PARAMS = ("providerName", "service", "userName", "purpose", "details", "timePreference")
+_STREAM_TWIML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n  <Connect>\n'
+    '    <Stream url="{ws_url}">\n'
+    + "".join(f'      <Parameter name="{name}" value="{{{name}}}"/>\n' for name in _STREAM_PARAMS)
+    + "    </Stream>\n  </Connect>\n</Response>"
+)
+_RECORD_TWIML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n'
+    '  <Say voice="Polly.Joanna">Hello, this is an AI assistant calling on behalf of {user}. '
+    "I'm calling to inquire about {service}. {purpose_text} "
+    "{time_text} "
+    "{details}</Say>\n"
+    '  <Pause length="2"/>\n'
+    '  <Say voice="Polly.Joanna">Could you please let me know your available times?</Say>\n'
+    '  <Record maxLength="60" transcribe="true" transcribeCallback="{callback_url}"/>\n'
+    "</Response>"
+)
 
 
 # ---------------------------------------------------------------------------
@@ -41,52 +178,54 @@ async def verify_phone(req: VerifyPhoneRequest):
     auth = _twilio_auth()
     base = _twilio_base()
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        if req.action == "start_verification":
-            resp = await client.post(
-                f"{base}/OutgoingCallerIds.json",
-                headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
-                data={"PhoneNumber": req.phoneNumber, "FriendlyName": f"User Verified: {req.phoneNumber}"},
-            )
-            data = resp.json()
-            if not resp.is_success:
-                if data.get("code") == 21450:
-                    return {"success": True, "alreadyVerified": True, "message": "This number is already verified as a caller ID"}
-                raise HTTPException(status_code=resp.status_code, detail=data.get("message", "Failed to start verification"))
-            return {
-                "success": True,
-                "validationCode": data.get("validation_code"),
-                "callSid": data.get("call_sid"),
-                "message": "Twilio is calling your phone. Enter the code shown when prompted.",
-            }
-
-        elif req.action == "check_verification":
-            resp = await client.get(
-                f"{base}/OutgoingCallerIds.json?PhoneNumber={url_quote(req.phoneNumber or '')}",
-                headers={"Authorization": f"Basic {auth}"},
-            )
-            data = resp.json()
-            if not resp.is_success:
-                raise HTTPException(status_code=resp.status_code, detail="Failed to check verification status")
-            is_verified = bool(data.get("outgoing_caller_ids"))
-            return {
-                "success": True,
-                "verified": is_verified,
-                "callerIdSid": data["outgoing_caller_ids"][0]["sid"] if is_verified else None,
-            }
-
-        elif req.action == "list_verified":
-            resp = await client.get(
-                f"{base}/OutgoingCallerIds.json",
-                headers={"Authorization": f"Basic {auth}"},
-            )
-            data = resp.json()
-            if not resp.is_success:
-                raise HTTPException(status_code=resp.status_code, detail="Failed to list verified numbers")
-            return {"success": True, "callerIds": data.get("outgoing_caller_ids", [])}
+    if req.action == "start_verification":
+        resp = await _twilio(
+            "POST",
+            f"{base}/OutgoingCallerIds.json",
+            headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
+            data={"PhoneNumber": req.phoneNumber, "FriendlyName": f"User Verified: {req.phoneNumber}"},
+        )
+        data = resp.json()
+        if not resp.is_success:
+            if data.get("code") == 21450:
+                return {"success": True, "alreadyVerified": True, "message": "This number is already verified as a caller ID"}
+            raise HTTPException(status_code=resp.status_code, detail=data.get("message", "Failed to start verification"))
+        return {
+            "success": True,
+            "validationCode": data.get("validation_code"),
+            "callSid": data.get("call_sid"),
+            "message": "Twilio is calling your phone. Enter the code shown when prompted.",
+        }
+
+    elif req.action == "check_verification":
+        resp = await _twilio(
+            "GET",
+            f"{base}/OutgoingCallerIds.json?PhoneNumber={url_quote(req.phoneNumber or '')}",
+            headers={"Authorization": f"Basic {auth}"},
+        )
+        data = resp.json()
+        if not resp.is_success:
+            raise HTTPException(status_code=resp.status_code, detail="Failed to check verification status")
+        is_verified = bool(data.get("outgoing_caller_ids"))
+        return {
+            "success": True,
+            "verified": is_verified,
+            "callerIdSid": data["outgoing_caller_ids"][0]["sid"] if is_verified else None,
+        }
+
+    elif req.action == "list_verified":
+        resp = await _twilio(
+            "GET",
+            f"{base}/OutgoingCallerIds.json",
+            headers={"Authorization": f"Basic {auth}"},
+        )
+        data = resp.json()
+        if not resp.is_success:
+            raise HTTPException(status_code=resp.status_code, detail="Failed to list verified numbers")
+        return {"success": True, "callerIds": data.get("outgoing_caller_ids", [])}
 
-        else:
-            raise HTTPException(status_code=400, detail="Invalid action")
+    else:
+        raise HTTPException(status_code=400, detail="Invalid action")
 
 
 # ---------------------------------------------------------------------------
@@ -94,52 +233,32 @@ async def verify_phone(req: VerifyPhoneRequest):
 # ---------------------------------------------------------------------------
 @router.post("/test-call")
 async def test_call(req: TestCallRequest):
-    sid = os.getenv("TWILIO_SID") or os.getenv("TWILIO_ACCOUNT_SID")
-    token = os.getenv("TWILIO_AUTH_TOKEN")
-    if not sid or not token:
+    sid = _TWILIO_SID
+    if not _TWILIO_TOKEN_BASIC:
         raise HTTPException(status_code=500, detail="Twilio credentials not configured (need TWILIO_SID and TWILIO_AUTH_TOKEN)")
     if not sid.startswith("AC"):
         raise HTTPException(status_code=500, detail=f"Invalid TWILIO_SID format -- should start with 'AC'")
 
-    import base64
-    auth = base64.b64encode(f"{sid}:{token}".encode()).decode()
-    base = f"https://api.twilio.com/2010-04-01/Accounts/{sid}"
-
-    # Build WebSocket URL for media stream -- points back to our own backend
-    backend_url = os.getenv("PUBLIC_URL") or os.getenv("NGROK_PUBLIC_URL") or ""
-    ws_url = backend_url.replace("https://", "wss://").replace("http://", "ws://") + "/api/twilio/media-stream"
-
-    twiml = (
-        '<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n  <Connect>\n'
-        f'    <Stream url="{ws_url}">\n'
-        f'      <Parameter name="providerName" value="{url_quote(req.providerName)}"/>\n'
-        f'      <Parameter name="service" value="{url_quote(req.service)}"/>\n'
-        f'      <Parameter name="userName" value="{url_quote(req.userName)}"/>\n'
-        f'      <Parameter name="purpose" value="{url_quote(req.purpose)}"/>\n'
-        f'      <Parameter name="details" value="{url_quote(req.details)}"/>\n'
-        f'      <Parameter name="timePreference" value="{url_quote(req.timePreference)}"/>\n'
-        "    </Stream>\n  </Connect>\n</Response>"
+    auth = _TWILIO_TOKEN_BASIC
+    base = _TWILIO_BASE
+
+    # The media-stream WebSocket URL points back to our own backend
+    twiml = _STREAM_TWIML.format_map(
+        {"ws_url": _MEDIA_STREAM_URL, **{name: url_quote(getattr(req, name)) for name in _STREAM_PARAMS}}
     )
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        # Get a Twilio phone number to call from
-        nums_resp = await client.get(
-            f"{base}/IncomingPhoneNumbers.json?PageSize=1",
-            headers={"Authorization": f"Basic {auth}"},
-        )
-        nums = nums_resp.json()
-        if not nums_resp.is_success or not nums.get("incoming_phone_numbers"):
-            raise HTTPException(status_code=500, detail="No Twilio phone number found in your account")
-        from_number = nums["incoming_phone_numbers"][0]["phone_number"]
+    # Get a Twilio phone number to call from
+    from_number = await _test_from_number(sid, base, auth)
 
-        call_resp = await client.post(
-            f"{base}/Calls.json",
-            headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
-            data={"To": req.toNumber, "From": from_number, "Twiml": twiml},
-        )
-        call_data = call_resp.json()
-        if not call_resp.is_success:
-            raise HTTPException(status_code=call_resp.status_code, detail=call_data.get("message", "Failed to initiate call"))
+    call_resp = await _twilio(
+        "POST",
+        f"{base}/Calls.json",
+        headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
+        data={"To": req.toNumber, "From": from_number, "Twiml": twiml},
+    )
+    call_data = call_resp.json()
+    if not call_resp.is_success:
+        raise HTTPException(status_code=call_resp.status_code, detail=call_data.get("message", "Failed to initiate call"))
 
     return {
         "success": True,
@@ -159,47 +278,44 @@ async def make_call(req: MakeCallRequest):
     auth = _twilio_auth()
     base = _twilio_base()
 
-    backend_url = os.getenv("PUBLIC_URL") or os.getenv("NGROK_PUBLIC_URL") or ""
-    callback_url = backend_url.rstrip("/") + "/api/twilio/call-handler"
+    callback_url = _CALL_HANDLER_URL
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        # Verify caller ID first
-        verify_resp = await client.get(
-            f"{base}/OutgoingCallerIds.json?PhoneNumber={url_quote(req.fromNumber)}",
-            headers={"Authorization": f"Basic {auth}"},
-        )
-        verify_data = verify_resp.json()
-        if not verify_data.get("outgoing_caller_ids"):
-            raise HTTPException(status_code=400, detail="Caller ID not verified. Verify your phone number first.")
-
-        purpose_text = {"new_appointment": "We would like to book an appointment."}.get(req.purpose, "")
-        twiml = (
-            '<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n'
-            f'  <Say voice="Polly.Joanna">Hello, this is an AI assistant calling on behalf of {req.userName}. '
-            f"I'm calling to inquire about {req.service}. {purpose_text} "
-            f'{("Our preferred time is " + req.timePreference + ".") if req.timePreference else ""} '
-            f"{req.details}</Say>\n"
-            '  <Pause length="2"/>\n'
-            '  <Say voice="Polly.Joanna">Could you please let me know your available times?</Say>\n'
-            f'  <Record maxLength="60" transcribe="true" transcribeCallback="{callback_url}"/>\n'
-            "</Response>"
-        )
-
-        call_resp = await client.post(
-            f"{base}/Calls.json",
-            headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
-            data={
-                "To": req.toNumber,
-                "From": req.fromNumber,
-                "Twiml": twiml,
-                "StatusCallback": callback_url,
-                "StatusCallbackEvent": "initiated ringing answered completed",
-                "StatusCallbackMethod": "POST",
-            },
-        )
-        call_data = call_resp.json()
-        if not call_resp.is_success:
-            raise HTTPException(status_code=call_resp.status_code, detail=call_data.get("message", "Failed to initiate call"))
+    # Verify caller ID first
+    verify_resp = await _twilio(
+        "GET",
+        f"{base}/OutgoingCallerIds.json?PhoneNumber={url_quote(req.fromNumber)}",
+        headers={"Authorization": f"Basic {auth}"},
+    )
+    verify_data = verify_resp.json()
+    if not verify_data.get("outgoing_caller_ids"):
+        raise HTTPException(status_code=400, detail="Caller ID not verified. Verify your phone number first.")
+
+    purpose_text = {"new_appointment": "We would like to book an appointment."}.get(req.purpose, "")
+    twiml = _RECORD_TWIML.format_map({
+        "user": req.userName,
+        "service": req.service,
+        "purpose_text": purpose_text,
+        "time_text": f"Our preferred time is {req.timePreference}." if req.timePreference else "",
+        "details": req.details,
+        "callback_url": callback_url,
+    })
+
+    call_resp = await _twilio(
+        "POST",
+        f"{base}/Calls.json",
+        headers={"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"},
+        data={
+            "To": req.toNumber,
+            "From": req.fromNumber,
+            "Twiml": twiml,
+            "StatusCallback": callback_url,
+            "StatusCallbackEvent": "initiated ringing answered completed",
+            "StatusCallbackMethod": "POST",
+        },
+    )
+    call_data = call_resp.json()
+    if not call_resp.is_success:
+        raise HTTPException(status_code=call_resp.status_code, detail=call_data.get("message", "Failed to initiate call"))
 
     return {
         "success": True,
@@ -248,15 +364,21 @@ async def media_stream(ws: WebSocket):
         "purpose": "",
         "details": "",
         "time_preference": "",
-        "conversation_history": [],
-        "audio_buffer": bytearray(),
+        "conversation_history": deque(maxlen=HISTORY_KEEP),  # only the tail is sent to the LLM
+        "audio_chunks": deque(),  # inbound mu-law frames, joined once per processing window
+        "buffer_len": 0,
         "is_processing": False,
+        "media_prefix": "",
+        "mark_frame": "",
     }
 
     try:
         while True:
-            raw = await ws.receive_text()
-            msg = json.loads(raw)
+            # Raw ASGI message: orjson parses text or binary frames directly
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            msg = orjson.loads(message.get("text") or message.get("bytes") or b"{}")
             event = msg.get("event")
 
             if event == "connected":
@@ -264,6 +386,14 @@ async def media_stream(ws: WebSocket):
 
             elif event == "start":
                 context["stream_sid"] = msg.get("streamSid", "")
+                # Outbound frames only vary by payload; pre-render the rest once per stream
+                sid_json = orjson.dumps(context["stream_sid"]).decode()
+                context["media_prefix"] = '{"event":"media","streamSid":' + sid_json + ',"media":{"payload":"'
+                context["mark_frame"] = orjson.dumps({
+                    "event": "mark",
+                    "streamSid": context["stream_sid"],
+                    "mark": {"name": "audio_complete"},
+                }).decode()
                 start_info = msg.get("start", {})
                 context["call_sid"] = start_info.get("callSid", "")
                 cp = start_info.get("customParameters", {})
@@ -273,16 +403,17 @@ async def media_stream(ws: WebSocket):
                 context["purpose"] = cp.get("purpose", "new_appointment")
                 context["details"] = cp.get("details", "")
                 context["time_preference"] = cp.get("timePreference", "flexible")
-                # Send initial greeting after a short delay
-                asyncio.get_event_loop().call_later(
-                    1.0, lambda: asyncio.ensure_future(_generate_and_send(ws, context, is_initial=True))
-                )
+                _prepare_prompts(context)
+                # Synthesize the greeting right away; only its playback waits out the warm-up delay
+                play_at = asyncio.get_running_loop().time() + GREETING_DELAY
+                _spawn(_generate_and_send(ws, context, is_initial=True, play_at=play_at))
 
             elif event == "media":
-                audio_bytes = b64decode(msg["media"]["payload"])
-                context["audio_buffer"].extend(audio_bytes)
+                audio_bytes = _decode_payload(msg["media"]["payload"])
+                context["audio_chunks"].append(audio_bytes)
+                context["buffer_len"] += len(audio_bytes)
                 # Process when ~2 seconds accumulated (8kHz mu-law = 16000 samples)
-                if len(context["audio_buffer"]) >= 16000 and not context["is_processing"]:
+                if context["buffer_len"] >= 16000 and not context["is_processing"]:
                     asyncio.ensure_future(_process_audio_and_respond(ws, context))
 
             elif event == "stop":
@@ -299,23 +430,77 @@ async def media_stream(ws: WebSocket):
 
 # -- helpers for the WebSocket pipeline ------------------------------------
 
+GREETING_DELAY = 1.0  # seconds after stream start before the greeting plays
+HISTORY_KEEP = 6  # conversation turns kept per call for LLM context
+FRAME_BYTES = 640  # one outbound media frame: 80ms of 8kHz mu-law
+MEDIA_BATCH = 8  # outbound media frames sent per batch (8 x 80ms = 640ms of audio)
+SEND_AHEAD = 1.0  # seconds of audio kept queued at Twilio ahead of playback
+_MEDIA_SUFFIX = '"}}'
+
+# Strong refs to fire-and-forget tasks so they aren't garbage-collected mid-flight
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+# Codec work runs in a worker thread so a long utterance never stalls other
+# calls' I/O on the event loop; NumPy releases the GIL.
+def _decode_inbound(mulaw_8k: bytes) -> bytes:
+    """Twilio mu-law @ 8kHz -> PCM @ 16kHz for STT."""
+    return mulaw_to_pcm_resampled(mulaw_8k, 8000, 16000)
+
+
+async def _wait_until(deadline: float | None) -> float:
+    """Sleep until ``deadline`` (loop time) if it is in the future; return the current loop time."""
+    loop = asyncio.get_running_loop()
+    if deadline is not None and deadline > loop.time():
+        await asyncio.sleep(deadline - loop.time())
+    return loop.time()
+
+
+async def _send_frames(ws: WebSocket, prefix: str, data: bytes, sent: int, t0: float) -> int:
+    """Send ``data`` as media frames and return the running total of bytes sent.
+
+    Twilio takes one media event per message, so frames go out individually but
+    back-to-back in batches. Each batch is paced against a monotonic deadline
+    (audio time since ``t0``, minus SEND_AHEAD) so sleeps never accumulate drift.
+    """
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(data), FRAME_BYTES):
+        if sent % (FRAME_BYTES * MEDIA_BATCH) == 0:
+            delay = t0 + sent / 8000 - SEND_AHEAD - loop.time()  # 8000 mu-law bytes per second
+            if delay > 0:
+                await asyncio.sleep(delay)
+        frame = data[i : i + FRAME_BYTES]
+        # base64 needs no JSON escaping, so each frame is prefix + payload + suffix
+        await ws.send_text(prefix + b64encode(frame).decode() + _MEDIA_SUFFIX)
+        sent += len(frame)
+    return sent
+
+
 async def _process_audio_and_respond(ws: WebSocket, ctx: dict):
-    if ctx["is_processing"] or not ctx["audio_buffer"]:
+    if ctx["is_processing"] or not ctx["buffer_len"]:
         return
     ctx["is_processing"] = True
     try:
-        raw = bytes(ctx["audio_buffer"])
-        ctx["audio_buffer"] = bytearray()
+        raw = b"".join(ctx["audio_chunks"])
+        ctx["audio_chunks"].clear()
+        ctx["buffer_len"] = 0
 
-        pcm_8k = mulaw_to_pcm(raw)
-        pcm_16k = resample(pcm_8k, 8000, 16000)
+        pcm_16k = await asyncio.to_thread(_decode_inbound, raw)
         transcription = await _transcribe(pcm_16k)
         if not transcription or len(transcription.strip()) < 2:
             ctx["is_processing"] = False
             return
 
         print(f"Provider said: {transcription}")
-        await _broadcast(ctx["call_sid"], "user", transcription)
+        # The transcript broadcast is off the critical path; don't hold the reply for it
+        _broadcast(ctx["call_sid"], "user", transcription)
         ctx["conversation_history"].append({"role": "user", "content": transcription})
         await _generate_and_send(ws, ctx, is_initial=False)
     except Exception as exc:
@@ -324,87 +509,111 @@ async def _process_audio_and_respond(ws: WebSocket, ctx: dict):
         ctx["is_processing"] = False
 
 
-async def _generate_and_send(ws: WebSocket, ctx: dict, *, is_initial: bool):
+async def _generate_and_send(ws: WebSocket, ctx: dict, *, is_initial: bool, play_at: float | None = None):
+    """Generate, synthesize and stream a reply; ``play_at`` (loop time) holds back sending."""
     try:
         ai_text = await _generate_ai_response(ctx, is_initial)
         print(f"AI says: {ai_text}")
-        await _broadcast(ctx["call_sid"], "ai", ai_text)
         ctx["conversation_history"].append({"role": "assistant", "content": ai_text})
 
-        audio_pcm_22k = await _tts(ai_text)
-        pcm_8k = resample(audio_pcm_22k, 22050, 8000)
-        mulaw_data = pcm_to_mulaw(pcm_8k)
-
-        chunk_size = 640  # 80ms at 8kHz
-        for i in range(0, len(mulaw_data), chunk_size):
-            chunk = mulaw_data[i : i + chunk_size]
-            payload = b64encode(chunk).decode()
-            await ws.send_text(json.dumps({
-                "event": "media",
-                "streamSid": ctx["stream_sid"],
-                "media": {"payload": payload},
-            }))
-            await asyncio.sleep(0.01)
-
-        await ws.send_text(json.dumps({
-            "event": "mark",
-            "streamSid": ctx["stream_sid"],
-            "mark": {"name": "audio_complete"},
-        }))
+        _broadcast(ctx["call_sid"], "ai", ai_text)
+
+        # Forward speech to Twilio as it is synthesized, in whole frames
+        prefix = ctx["media_prefix"]
+        pending = b""
+        sent = 0
+        t0 = None
+        async for chunk in _tts_stream(ai_text):
+            pending += chunk
+            ready = len(pending) - len(pending) % FRAME_BYTES
+            if not ready:
+                continue
+            if t0 is None:
+                t0 = await _wait_until(play_at)
+            sent = await _send_frames(ws, prefix, pending[:ready], sent, t0)
+            pending = pending[ready:]
+        if pending:
+            if t0 is None:
+                t0 = await _wait_until(play_at)
+            await _send_frames(ws, prefix, pending, sent, t0)
+
+        await ws.send_text(ctx["mark_frame"])
     except Exception as exc:
         print(f"Generate/send error: {exc}")
 
 
 async def _transcribe(pcm_16k: bytes) -> str:
-    wav = create_wav(pcm_16k, 16000)
-    api_key = os.getenv("ELEVENLABS_API_KEY", "")
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            "https://api.elevenlabs.io/v1/speech-to-text",
-            headers={"xi-api-key": api_key},
-            files={"file": ("audio.wav", wav, "audio/wav")},
-            data={"model_id": "scribe_v2", "language_code": "eng"},
-        )
+    resp = await _send(
+        "POST",
+        "https://api.elevenlabs.io/v1/speech-to-text",
+        headers={"xi-api-key": _ELEVEN_KEY},
+        files={"file": ("audio.wav", WavReader(pcm_16k, 16000), "audio/wav")},
+        data={"model_id": "scribe_v2", "language_code": "eng"},
+    )
     if not resp.is_success:
         print(f"STT error: {resp.text}")
         return ""
     return resp.json().get("text", "")
 
 
+# Prompt templates -- filled once per call in _prepare_prompts, not on every turn
+CALL_SYS_INITIAL = (
+    "You are an AI phone assistant making a call to book an appointment.\n"
+    "Generate the opening message for a call to {provider}.\n"
+    "Be polite, professional, and clearly state you're an AI calling on behalf of {user}.\n"
+    "Keep it concise (2-3 sentences max). Speak naturally as if on a phone call."
+)
+CALL_USER_INITIAL = (
+    "Generate opening for:\nService: {service}\nPurpose: {purpose}\n"
+    "Details: {details}\nTime preference: {time_preference}"
+)
+CALL_SYS_LIVE = (
+    "You are an AI phone assistant in a live phone conversation to book an appointment at {provider}.\n"
+    "Based on what the receptionist/staff said, generate an appropriate reply.\n"
+    "If they offered a time slot, confirm it and ask for confirmation details.\n"
+    "If they asked a question, answer it based on the context.\n"
+    "If they can't help, thank them politely.\n"
+    "Keep responses concise (1-2 sentences). Be natural and conversational."
+)
+CALL_USER_LIVE_CONTEXT = (
+    "\n\nService requested: {service}\nTime preference: {time_preference}\n"
+    "Additional context: {details}\n\nWhat should you say next?"
+)
+_CALL_PURPOSES = {"new_appointment": "Book new appointment", "reschedule": "Reschedule"}
+
+
+def _prepare_prompts(ctx: dict) -> None:
+    """Render the per-call prompt pieces once the stream's custom parameters are known."""
+    details = ctx["details"] or "None"
+    time_preference = ctx["time_preference"] or "Flexible"
+    ctx["sys_prompt_initial"] = CALL_SYS_INITIAL.format(provider=ctx["provider_name"], user=ctx["user_name"])
+    ctx["user_prompt_initial"] = CALL_USER_INITIAL.format(
+        service=ctx["service"],
+        purpose=_CALL_PURPOSES.get(ctx["purpose"], ctx["purpose"]),
+        details=details,
+        time_preference=time_preference,
+    )
+    ctx["sys_prompt_live"] = CALL_SYS_LIVE.format(provider=ctx["provider_name"])
+    ctx["user_prompt_live_context"] = CALL_USER_LIVE_CONTEXT.format(
+        service=ctx["service"], time_preference=time_preference, details=details
+    )
+
+
 async def _generate_ai_response(ctx: dict, is_initial: bool) -> str:
+    history = ctx["conversation_history"]
     if is_initial:
-        sys_prompt = (
-            f"You are an AI phone assistant making a call to book an appointment.\n"
-            f"Generate the opening message for a call to {ctx['provider_name']}.\n"
-            f"Be polite, professional, and clearly state you're an AI calling on behalf of {ctx['user_name']}.\n"
-            "Keep it concise (2-3 sentences max). Speak naturally as if on a phone call."
-        )
-        purpose_text = {"new_appointment": "Book new appointment", "reschedule": "Reschedule"}.get(ctx["purpose"], ctx["purpose"])
-        user_prompt = (
-            f"Generate opening for:\nService: {ctx['service']}\nPurpose: {purpose_text}\n"
-            f"Details: {ctx['details'] or 'None'}\nTime preference: {ctx['time_preference'] or 'Flexible'}"
-        )
+        sys_prompt = ctx["sys_prompt_initial"]
+        user_prompt = ctx["user_prompt_initial"]
     else:
-        sys_prompt = (
-            f"You are an AI phone assistant in a live phone conversation to book an appointment at {ctx['provider_name']}.\n"
-            "Based on what the receptionist/staff said, generate an appropriate reply.\n"
-            "If they offered a time slot, confirm it and ask for confirmation details.\n"
-            "If they asked a question, answer it based on the context.\n"
-            "If they can't help, thank them politely.\n"
-            "Keep responses concise (1-2 sentences). Be natural and conversational."
-        )
-        last_msg = ctx["conversation_history"][-1]["content"] if ctx["conversation_history"] else "Hello?"
-        user_prompt = (
-            f'The receptionist said: "{last_msg}"\n\nService requested: {ctx["service"]}\n'
-            f"Time preference: {ctx['time_preference'] or 'Flexible'}\n"
-            f"Additional context: {ctx['details'] or 'None'}\n\nWhat should you say next?"
-        )
+        sys_prompt = ctx["sys_prompt_live"]
+        last_msg = history[-1]["content"] if history else "Hello?"
+        user_prompt = "".join(('The receptionist said: "', last_msg, '"', ctx["user_prompt_live_context"]))
 
     data = await llm.chat_completion(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": sys_prompt},
-            *ctx["conversation_history"][-6:],
+            *history,
             {"role": "user", "content": user_prompt},
         ],
         max_tokens=150,
@@ -413,33 +622,63 @@ async def _generate_ai_response(ctx: dict, is_initial: bool) -> str:
     return (data.get("choices") or [{}])[0].get("message", {}).get("content", "Could you please repeat that?")
 
 
-async def _tts(text: str) -> bytes:
-    """Call ElevenLabs TTS and return raw PCM bytes at 22050 Hz."""
-    api_key = os.getenv("ELEVENLABS_API_KEY", "")
+async def _tts_stream(text: str) -> AsyncIterator[bytes]:
+    """Stream ElevenLabs TTS as raw mu-law @ 8kHz -- Twilio's wire format, so no transcoding."""
     voice_id = "EXAVITQu4vr4xnSDxMaL"  # Sarah
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}?output_format=pcm_22050",
-            headers={"xi-api-key": api_key, "Content-Type": "application/json"},
-            json={
-                "text": text,
-                "model_id": "eleven_turbo_v2_5",
-                "voice_settings": {"stability": 0.5, "similarity_boost": 0.75, "style": 0.3, "use_speaker_boost": True},
-            },
-        )
-    if not resp.is_success:
-        raise RuntimeError(f"TTS failed: {resp.text}")
-    return resp.content  # raw PCM 16-bit LE at 22050 Hz
+    resp = await _send(
+        "POST",
+        f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream?output_format=ulaw_8000",
+        headers={"xi-api-key": _ELEVEN_KEY, "Content-Type": "application/json"},
+        json={
+            "text": text,
+            "model_id": "eleven_turbo_v2_5",
+            "voice_settings": {"stability": 0.5, "similarity_boost": 0.75, "style": 0.3, "use_speaker_boost": True},
+        },
+        stream=True,
+    )
+    try:
+        if not resp.is_success:
+            await resp.aread()
+            raise RuntimeError(f"TTS failed: {resp.text}")
+        async for chunk in resp.aiter_bytes():
+            yield chunk
+    finally:
+        await resp.aclose()
+
+
+BROADCAST_FLUSH_DELAY = 0.05  # seconds transcript lines are held to share one request
+
+# call SID -> transcript messages waiting for the next flush
+_pending_broadcasts: dict[str, list[dict]] = {}
 
 
-async def _broadcast(call_sid: str, speaker: str, text: str):
-    """Broadcast transcript to frontend via Supabase Realtime."""
+def _broadcast(call_sid: str, speaker: str, text: str) -> None:
+    """Queue a transcript line for the frontend; lines are published in batches."""
     if not call_sid:
         return
+    message = {
+        "topic": f"call:{call_sid}",
+        "event": "transcript",
+        "payload": {"speaker": speaker, "text": text, "timestamp": int(time.time() * 1000)},
+    }
+    pending = _pending_broadcasts.get(call_sid)
+    if pending is None:
+        _pending_broadcasts[call_sid] = [message]
+        _spawn(_flush_broadcasts(call_sid))
+    else:
+        pending.append(message)
+
+
+async def _flush_broadcasts(call_sid: str):
+    """Publish a call's queued transcript lines via Supabase Realtime in one HTTP request."""
+    await asyncio.sleep(BROADCAST_FLUSH_DELAY)
+    messages = _pending_broadcasts.pop(call_sid, [])
+    if not messages:
+        return
     try:
-        import time
-        sb = get_supabase()
-        channel = sb.channel(f"call:{call_sid}")
-        channel.send_broadcast("transcript", {"speaker": speaker, "text": text, "timestamp": int(time.time() * 1000)})
+        url, headers = broadcast_endpoint()
+        resp = await _client.post(url, headers=headers, json={"messages": messages}, timeout=5)
+        if not resp.is_success:
+            print(f"Broadcast error: {resp.status_code} {resp.text}")
     except Exception as exc:
         print(f"Broadcast error: {exc}")
@@ -2,9 +2,13 @@
 
 Mounts all routers and configures CORS.
 Run with: uvicorn server:app --host 0.0.0.0 --port 3001 --reload
+Production: uvicorn server:app --host 0.0.0.0 --port 3001 --loop uvloop --http httptools --workers 4
+(uvloop and httptools ship with uvicorn[standard].)
+`python server.py` also starts the app on uvloop + httptools.
 """
 
 import sys
+import asyncio
 from pathlib import Path
 
 # Ensure the backend directory is on sys.path so local packages resolve correctly
@@ -14,12 +18,35 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routers import ai, elevenlabs, twilio, calendar, profiles
+from services import llm
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on missing config instead of 503-ing every AI request
+    llm.check_config()
+    # Pay the TLS handshake to OpenAI now rather than on the first user request
+    warmup = asyncio.create_task(llm.warm())
+    yield
+    # Make sure the warm-up GET is gone before its client is closed below
+    warmup.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup
+    # Close pooled upstream HTTP clients on shutdown
+    await elevenlabs.aclose()
+    await calendar.aclose()
+    await twilio.aclose()
+    await llm.aclose()
 
-app = FastAPI(title="CallConnect AI Backend")
+
+app = FastAPI(title="CallConnect AI Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,3 +66,10 @@ app.include_router(profiles.router)
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop event loop + httptools parser (both installed by uvicorn[standard])
+    uvicorn.run("server:app", host="0.0.0.0", port=3001, loop="uvloop", http="httptools")
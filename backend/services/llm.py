@@ -3,10 +3,14 @@
 import os
 import json
 import asyncio
+from typing import AsyncIterator
 import httpx
+import orjson
 from fastapi import HTTPException
+from utils.retry import retry_wait
 
 OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+_WARMUP_URL = "https://api.openai.com/v1/models"
 
 # Model mapping: callers still pass the old Lovable/Google model names,
 # but we transparently route to OpenAI equivalents.
@@ -17,35 +21,109 @@ _MODEL_MAP = {
 
 MAX_RETRIES = 4
 INITIAL_BACKOFF = 2  # seconds
+MAX_WAIT = 30  # cap on any single retry sleep
 
+# Hedge threshold for latency-critical callers. Non-streamed completions routinely
+# take ~1-2s, so hedging any earlier would duplicate most requests.
+HEDGE_AFTER_MS = 2500
 
-def _api_key() -> str:
-    key = os.getenv("OPENAI_API_KEY", "").strip()
-    if not key:
-        raise HTTPException(
-            status_code=503,
-            detail="OPENAI_API_KEY is not configured in backend/.env -- add it and restart the server",
-        )
-    return key
+# Shared pooled client: keeps TLS connections to OpenAI warm across requests.
+# The transport retries failed connects (DNS, TCP/TLS setup) itself, leaving the
+# loop in chat_completion to deal only with 429s. http2/limits must live on the
+# transport when one is passed explicitly.
+_client = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, keepalive_expiry=30),
+        retries=2,
+    ),
+    timeout=httpx.Timeout(60, connect=5),
+)
 
 
-def _resolve_model(model: str) -> str:
-    return _MODEL_MAP.get(model, model)
+async def aclose() -> None:
+    await _client.aclose()
+
+
+# Read once at import (server.py loads .env first); check_config() fails startup
+# when it is missing, so the request path never has to validate it.
+_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+_HEADERS = {"Authorization": f"Bearer {_API_KEY}", "Content-Type": "application/json"}
+
+
+def check_config() -> None:
+    """Raise at startup if the OpenAI key is not configured."""
+    if not _API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not configured in backend/.env -- add it and restart the server")
+
+
+async def _post(payload: bytes, hedge_after_ms: int | None) -> httpx.Response:
+    """POST to OpenAI; if ``hedge_after_ms`` elapses first, race a duplicate request
+    and return whichever finishes first, cancelling the other."""
+    headers = _HEADERS
+    if hedge_after_ms is None:
+        return await _client.post(OPENAI_URL, headers=headers, content=payload)
+
+    primary = asyncio.create_task(_client.post(OPENAI_URL, headers=headers, content=payload))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after_ms / 1000)
+    if done:
+        return primary.result()
+
+    hedge = asyncio.create_task(_client.post(OPENAI_URL, headers=headers, content=payload))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # Prefer a successful response; fall back to the other request if one fails
+                if task.exception() is None:
+                    return task.result()
+        return primary.result()  # both failed: surface the primary's error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def warm() -> None:
+    """Open a pooled connection to OpenAI ahead of the first real request.
+
+    Run in the background at startup; failures are logged and otherwise ignored.
+    """
+    try:
+        await _client.get(_WARMUP_URL, headers=_HEADERS, timeout=5)
+    except Exception as e:
+        print(f"[LLM] Connection warm-up failed: {e!r}")
+
+
+def _system_cache_block(text: str) -> dict:
+    """A system message for a static prompt block.
+
+    OpenAI caches prompt prefixes automatically when they are byte-identical across
+    requests, so static blocks must come first and never contain per-request values.
+    """
+    return {"role": "system", "content": text}
 
 
 async def chat_completion(
     *,
     model: str = "gpt-4o-mini",
     messages: list[dict],
+    system: list[str] | None = None,
     tools: list[dict] | None = None,
     tool_choice: dict | None = None,
     response_format: dict | None = None,
     max_tokens: int | None = None,
     temperature: float | None = None,
+    hedge_after_ms: int | None = None,
 ) -> dict:
-    """Call OpenAI and return the raw response dict. Retries on 429 with exponential backoff."""
-    resolved = _resolve_model(model)
-    body: dict = {"model": resolved, "messages": messages}
+    """Call OpenAI and return the raw response dict. Retries on 429 with exponential backoff.
+
+    ``system`` blocks are sent as leading system messages, in order, ahead of ``messages``.
+    ``hedge_after_ms`` sends a duplicate request if the first has not answered in time.
+    """
+    if system:
+        messages = [*(_system_cache_block(text) for text in system), *messages]
+    body: dict = {"model": _MODEL_MAP.get(model, model), "messages": messages}
     if tools:
         body["tools"] = tools
     if tool_choice:
@@ -57,17 +135,12 @@ async def chat_completion(
     if temperature is not None:
         body["temperature"] = temperature
 
+    # Serialized once and reused by every retry and hedge
+    payload = orjson.dumps(body)
+
     last_resp = None
     for attempt in range(MAX_RETRIES + 1):
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(
-                OPENAI_URL,
-                headers={
-                    "Authorization": f"Bearer {_api_key()}",
-                    "Content-Type": "application/json",
-                },
-                json=body,
-            )
+        resp = await _post(payload, hedge_after_ms)
         last_resp = resp
 
         if resp.status_code != 429:
@@ -75,40 +148,95 @@ async def chat_completion(
 
         # 429 -- wait and retry
         if attempt < MAX_RETRIES:
-            retry_after = resp.headers.get("retry-after")
-            if retry_after:
-                wait = float(retry_after)
-            else:
-                wait = INITIAL_BACKOFF * (2 ** attempt)
+            wait = retry_wait(
+                resp.headers.get("retry-after"), attempt, initial_backoff=INITIAL_BACKOFF, max_wait=MAX_WAIT
+            )
             print(f"[LLM] Rate-limited by OpenAI, retrying in {wait:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})")
             await asyncio.sleep(wait)
 
     if last_resp is None:
         raise HTTPException(status_code=502, detail="No response from OpenAI")
 
-    if last_resp.status_code == 429:
+    _raise_for_status(last_resp)
+    return orjson.loads(last_resp.content)
+
+
+def _raise_for_status(resp: httpx.Response) -> None:
+    """Map a final (post-retry) OpenAI error response onto an HTTPException."""
+    if resp.status_code == 429:
         raise HTTPException(status_code=429, detail="OpenAI rate limit exceeded after retries. Wait a moment and try again.")
-    if last_resp.status_code == 402:
+    if resp.status_code == 402:
         raise HTTPException(status_code=402, detail="AI credits exhausted")
-    if not last_resp.is_success:
-        detail = last_resp.text[:500] if last_resp.text else str(last_resp.status_code)
-        raise HTTPException(status_code=502, detail=f"OpenAI API error ({last_resp.status_code}): {detail}")
+    if not resp.is_success:
+        detail = resp.text[:500] if resp.text else str(resp.status_code)
+        raise HTTPException(status_code=502, detail=f"OpenAI API error ({resp.status_code}): {detail}")
+
+
+async def chat_completion_stream(
+    *,
+    model: str = "gpt-4o-mini",
+    messages: list[dict],
+    system: list[str] | None = None,
+    max_tokens: int | None = None,
+    temperature: float | None = None,
+) -> AsyncIterator[str]:
+    """Stream a completion, yielding content deltas as OpenAI generates them.
 
-    return last_resp.json()
+    Lets callers start downstream work (e.g. TTS) on the first tokens instead of
+    waiting for the whole reply. Retries 429s like ``chat_completion``, but only
+    before any output has been yielded.
+    """
+    if system:
+        messages = [*(_system_cache_block(text) for text in system), *messages]
+    body: dict = {"model": _MODEL_MAP.get(model, model), "messages": messages, "stream": True}
+    if max_tokens is not None:
+        body["max_tokens"] = max_tokens
+    if temperature is not None:
+        body["temperature"] = temperature
+    payload = orjson.dumps(body)
+    headers = _HEADERS
+
+    for attempt in range(MAX_RETRIES + 1):
+        async with _client.stream("POST", OPENAI_URL, headers=headers, content=payload) as resp:
+            if resp.status_code != 429 or attempt == MAX_RETRIES:
+                if not resp.is_success:
+                    await resp.aread()
+                    _raise_for_status(resp)
+                # Server-sent events: one "data: {...}" line per chunk, then "data: [DONE]"
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    choices = orjson.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+                return
+            wait = retry_wait(
+                resp.headers.get("retry-after"), attempt, initial_backoff=INITIAL_BACKOFF, max_wait=MAX_WAIT
+            )
+        # Sleep outside the stream so the connection goes back to the pool
+        print(f"[LLM] Rate-limited by OpenAI, retrying in {wait:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})")
+        await asyncio.sleep(wait)
 
 
 async def chat_with_tool(
     *,
     model: str = "gpt-4o-mini",
     messages: list[dict],
+    system: list[str] | None = None,
     tool_name: str,
     tool_description: str,
     tool_parameters: dict,
+    hedge_after_ms: int | None = None,
 ) -> dict:
     """Convenience: call LLM with a single forced tool and return the parsed arguments."""
     data = await chat_completion(
         model=model,
         messages=messages,
+        system=system,
         tools=[
             {
                 "type": "function",
@@ -120,6 +248,7 @@ async def chat_with_tool(
             }
         ],
         tool_choice={"type": "function", "function": {"name": tool_name}},
+        hedge_after_ms=hedge_after_ms,
     )
 
     tool_call = (data.get("choices") or [{}])[0].get("message", {}).get("tool_calls", [None])[0]
@@ -133,22 +262,32 @@ async def chat_json(
     *,
     model: str = "gpt-4o-mini",
     messages: list[dict],
+    system: list[str] | None = None,
+    hedge_after_ms: int | None = None,
 ) -> dict:
     """Convenience: call LLM with response_format=json_object and return parsed JSON."""
     data = await chat_completion(
         model=model,
         messages=messages,
+        system=system,
         response_format={"type": "json_object"},
+        hedge_after_ms=hedge_after_ms,
     )
 
     content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "")
-    # Clean potential markdown fencing
-    cleaned = content.replace("```json", "").replace("```", "").strip()
-    json_start = cleaned.find("{")
-    json_end = cleaned.rfind("}")
-    if json_start != -1 and json_end != -1:
-        cleaned = cleaned[json_start : json_end + 1]
+    # json_object mode returns bare JSON, so try it as-is before any cleanup
     try:
-        return json.loads(cleaned)
+        parsed = json.loads(content)
+        if isinstance(parsed, dict):
+            return parsed
     except json.JSONDecodeError:
-        return {"raw": content}
+        pass
+    # Fallback: pull the outermost object out of fenced or chatty output
+    json_start = content.find("{")
+    json_end = content.rfind("}")
+    if json_start != -1 and json_end > json_start:
+        try:
+            return json.loads(content[json_start : json_end + 1])
+        except json.JSONDecodeError:
+            pass
+    return {"raw": content}
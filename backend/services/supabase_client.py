@@ -13,3 +13,20 @@ def get_supabase() -> Client:
     if not url or not key:
         raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
     return create_client(url, key)
+
+
+@lru_cache()
+def broadcast_endpoint() -> tuple[str, dict]:
+    """Return the Realtime HTTP broadcast URL and service-role headers.
+
+    The sync client's realtime channels can't send broadcasts, so server-side
+    publishes go through the REST endpoint instead.
+    """
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+    return (
+        url.rstrip("/") + "/realtime/v1/api/broadcast",
+        {"apikey": key, "Authorization": f"Bearer {key}"},
+    )
@@ -1,88 +1,81 @@
 """Audio codec utilities for the Twilio media-stream WebSocket pipeline.
 
-Handles mu-law <-> PCM conversion, sample-rate conversion, and WAV creation.
+Decodes inbound mu-law to resampled PCM and wraps PCM as WAV for STT uploads.
+Outbound TTS is requested as mu-law directly, so there is no encoder here.
 """
 
+import io
 import struct
-import array
-import math
+from functools import lru_cache
+
+import numpy as np
+
+_PCM16 = np.dtype("<i2")
 
 # ---------------------------------------------------------------------------
-# mu-law lookup table (mu-law byte -> signed 16-bit linear PCM)
+# mu-law lookup table
+#
+# NumPy rather than ``audioop``: audioop is deprecated since 3.11 and removed in
+# 3.13, and table gathers already run the whole buffer in one C loop.
 # ---------------------------------------------------------------------------
-_ULAW_TO_LINEAR: list[int] = []
-for _i in range(256):
-    _mu = ~_i & 0xFF
-    _sign = _mu & 0x80
-    _exp = (_mu >> 4) & 0x07
-    _man = _mu & 0x0F
-    _sample = ((_man << 3) + 0x84) << _exp
-    _sample -= 0x84
-    _ULAW_TO_LINEAR.append(-_sample if _sign else _sample)
-
-
-def _linear_to_mulaw(sample: int) -> int:
-    BIAS = 0x84
-    MAX = 32635
-    sign = (sample >> 8) & 0x80
-    if sign:
-        sample = -sample
-    if sample > MAX:
-        sample = MAX
-    sample += BIAS
-    exponent = 7
-    exp_mask = 0x4000
-    while exponent > 0 and (sample & exp_mask) == 0:
-        exponent -= 1
-        exp_mask >>= 1
-    mantissa = (sample >> (exponent + 3)) & 0x0F
-    return (~(sign | (exponent << 4) | mantissa)) & 0xFF
+
+# mu-law byte -> signed 16-bit linear PCM, decoded for all 256 codes at once
+_mu = ~np.arange(256) & 0xFF
+_mag = ((((_mu & 0x0F) << 3) + 0x84) << ((_mu >> 4) & 0x07)) - 0x84
+_DECODE_LUT = np.where(_mu & 0x80, -_mag, _mag).astype(_PCM16)
+del _mu, _mag
 
 
 # ---------------------------------------------------------------------------
-# Public conversion functions
+# Inbound conversion (mu-law @ 8kHz -> PCM for STT)
 # ---------------------------------------------------------------------------
 
-def mulaw_to_pcm(mulaw_data: bytes) -> bytes:
-    """Convert mu-law bytes to signed-16-bit-LE PCM bytes."""
-    pcm = array.array("h", [_ULAW_TO_LINEAR[b] for b in mulaw_data])
+@lru_cache(maxsize=32)
+def _interp_grid(src_len: int, from_rate: int, to_rate: int) -> tuple[np.ndarray, np.ndarray]:
+    """Output sample positions and source index ramp for one (size, rate) pair.
+
+    Inbound Twilio buffers recur at the same few lengths, so the ramps are reused.
+    """
+    ratio = from_rate / to_rate
+    positions = np.arange(int(src_len / ratio)) * ratio
+    indices = np.arange(src_len)
+    positions.flags.writeable = indices.flags.writeable = False  # shared across calls
+    return positions, indices
+
+
+def _resample_array(src: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Linear-interpolation resampler for signed 16-bit samples."""
+    positions, indices = _interp_grid(len(src), from_rate, to_rate)
+    if not len(positions):
+        return np.empty(0, dtype=_PCM16)
+    # astype truncates toward zero, matching int() on each interpolated sample
+    return np.interp(positions, indices, src).astype(_PCM16)
+
+
+def mulaw_to_pcm_resampled(mulaw_data: bytes, from_rate: int, to_rate: int) -> bytes:
+    """Decode mu-law bytes to signed-16-bit-LE PCM at ``to_rate``.
+
+    Samples stay a NumPy array from decode through interpolation; bytes are built once.
+    """
+    # ndarray.take is a plain gather, roughly twice as fast as fancy indexing here
+    pcm = _DECODE_LUT.take(np.frombuffer(mulaw_data, dtype=np.uint8))
+    if from_rate != to_rate:
+        pcm = _resample_array(pcm, from_rate, to_rate)
     return pcm.tobytes()
 
 
-def pcm_to_mulaw(pcm_data: bytes) -> bytes:
-    """Convert signed-16-bit-LE PCM bytes to mu-law bytes."""
-    samples = array.array("h")
-    samples.frombytes(pcm_data)
-    return bytes(_linear_to_mulaw(s) for s in samples)
+_SIZE_FIELD = struct.Struct("<I")
 
 
-def resample(pcm_bytes: bytes, from_rate: int, to_rate: int) -> bytes:
-    """Linear-interpolation resampler for signed-16-bit-LE PCM."""
-    if from_rate == to_rate:
-        return pcm_bytes
-    src = array.array("h")
-    src.frombytes(pcm_bytes)
-    ratio = from_rate / to_rate
-    out_len = int(len(src) / ratio)
-    out = array.array("h", [0] * out_len)
-    for i in range(out_len):
-        src_idx = i * ratio
-        lo = int(src_idx)
-        hi = min(lo + 1, len(src) - 1)
-        frac = src_idx - lo
-        out[i] = int(src[lo] * (1 - frac) + src[hi] * frac)
-    return out.tobytes()
-
-
-def create_wav(pcm_bytes: bytes, sample_rate: int, num_channels: int = 1, bits: int = 16) -> bytes:
-    """Wrap raw signed-16-bit-LE PCM bytes in a WAV container."""
+@lru_cache(maxsize=8)
+def _wav_prefix(sample_rate: int, num_channels: int, bits: int) -> bytes:
+    """The 44-byte header for one format, with both size fields left at zero."""
     byte_rate = sample_rate * num_channels * (bits // 8)
     block_align = num_channels * (bits // 8)
-    data_size = len(pcm_bytes)
-    header = struct.pack(
+    return struct.pack(
         "<4sI4s4sIHHIIHH4sI",
         b"RIFF",
-        36 + data_size,
+        0,              # RIFF chunk size, filled per call
         b"WAVE",
         b"fmt ",
         16,             # chunk size
@@ -93,6 +86,46 @@ def create_wav(pcm_bytes: bytes, sample_rate: int, num_channels: int = 1, bits:
         block_align,
         bits,
         b"data",
-        data_size,
+        0,              # data size, filled per call
     )
-    return header + pcm_bytes
+
+
+def wav_header(data_size: int, sample_rate: int, num_channels: int = 1, bits: int = 16) -> bytes:
+    """The 44-byte RIFF/WAVE header for ``data_size`` bytes of PCM."""
+    header = bytearray(_wav_prefix(sample_rate, num_channels, bits))
+    _SIZE_FIELD.pack_into(header, 4, 36 + data_size)
+    _SIZE_FIELD.pack_into(header, 40, data_size)
+    return bytes(header)
+
+
+class WavReader:
+    """Seekable, read-only file object over a WAV header + PCM, without concatenating them.
+
+    Lets multipart uploads stream the WAV in chunks instead of building a full copy.
+    """
+
+    def __init__(self, pcm_bytes: bytes, sample_rate: int, num_channels: int = 1, bits: int = 16):
+        self._header = wav_header(len(pcm_bytes), sample_rate, num_channels, bits)
+        self._pcm = memoryview(pcm_bytes)
+        self._size = len(self._header) + len(pcm_bytes)
+        self._pos = 0
+
+    def read(self, size: int | None = -1) -> bytes:
+        start = self._pos
+        end = self._size if size is None or size < 0 else min(self._size, start + size)
+        head_len = len(self._header)
+        parts = []
+        if start < head_len:
+            parts.append(self._header[start:min(end, head_len)])
+        if end > head_len:
+            parts.append(self._pcm[max(start - head_len, 0) : end - head_len])
+        self._pos = end
+        return b"".join(parts)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
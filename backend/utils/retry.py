@@ -0,0 +1,23 @@
+"""Backoff policy shared by the upstream HTTP clients (OpenAI, Twilio, ElevenLabs)."""
+
+import time
+import random
+from email.utils import parsedate_to_datetime
+
+
+def retry_wait(retry_after: str | None, attempt: int, *, initial_backoff: float, max_wait: float) -> float:
+    """Seconds to sleep before retry number ``attempt`` (0-based).
+
+    Honours Retry-After (delta-seconds or HTTP-date); otherwise jittered exponential
+    backoff so concurrent callers don't retry in lockstep. Always capped at ``max_wait``.
+    """
+    wait = initial_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+    if retry_after:
+        try:
+            wait = float(retry_after)
+        except ValueError:
+            try:
+                wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(wait, 0.0), max_wait)
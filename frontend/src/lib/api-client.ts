@@ -60,6 +60,7 @@ export const ai = {
     details?: string;
     timePreference?: string;
     conversationHistory?: unknown[];
+    lastProviderMessage?: string;
   }) => post<{ message: string; intent: string }>('/api/ai/orchestrate', body),
 
   simulateResponse: (body: {
@@ -84,7 +85,7 @@ export const ai = {
     toolResults?: unknown[];
   }) => post<{ agentResponse: string; toolCalls: unknown[] }>('/api/ai/text-chat', body),
 
-  analyzeIntake: (body: { service: string; userInput?: string }) =>
+  analyzeIntake: (body: { service: string; userInput?: string; includeAllFields?: boolean }) =>
     post<{
       category: string;
       extractedInfo: Record<string, string>;
@@ -93,9 +94,23 @@ export const ai = {
       allFields: unknown[];
     }>('/api/ai/analyze-intake', body),
 
+  /** Static per-category field list; served with a long-lived Cache-Control and ETag. */
+  intakeFields: (category: string) =>
+    apiCall<unknown[]>(`/api/ai/intake-fields/${encodeURIComponent(category)}`),
+
   generateIntakeExample: (body: { service: string }) =>
     post<{ example: string }>('/api/ai/generate-intake-example', body),
 
+  analyzeAndExample: (body: { service: string; userInput?: string }) =>
+    post<{
+      category: string;
+      extractedInfo: Record<string, string>;
+      missingFields: unknown[];
+      optionalFields: unknown[];
+      allFields: unknown[];
+      example: string;
+    }>('/api/ai/analyze-and-example', body),
+
   generateCallScript: (body: {
     service: string;
     providerName: string;